@@ -0,0 +1,156 @@
+import json
+import time
+from array import array
+from typing import Iterable, Optional
+
+from app.metrics import REJECTED
+
+DEFAULT_SLOTS = 1 << 20
+
+
+class TokenBuckets:
+    """Token buckets for an unbounded key space in fixed memory.
+
+    Buckets live in two flat arrays (tokens, last refill) of `slots` doubles,
+    so a million slots cost 16 MB however many keys are seen. Each key maps
+    to two slots by hash and may proceed if either slot has tokens; both
+    are charged. A key that collides with a heavy one therefore still gets
+    through on its other slot, while the heavy key drains both of its own.
+    Idle slots refill from their timestamps, so nothing needs sweeping.
+
+    There is no lock. Two threads charging the same slot can both pass, which
+    over-admits by a request at worst. That is cheaper than a lock per call.
+    """
+
+    def __init__(self, rate: float, burst: float, slots: int = DEFAULT_SLOTS):
+        size = 1 << max(0, (slots - 1).bit_length())
+        self.rate = rate
+        self.burst = burst
+        self._mask = size - 1
+        self._tokens = array("d", [burst]) * size
+        self._stamps = array("d", [0.0]) * size
+
+    def __len__(self) -> int:
+        return self._mask + 1
+
+    def _refill(self, slot: int, now: float) -> float:
+        tokens = self._tokens[slot] + (now - self._stamps[slot]) * self.rate
+        return tokens if tokens < self.burst else self.burst
+
+    def wait(self, key, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """What acquire() would return, without charging anything. For checking
+        several keys before charging any of them."""
+        now = time.monotonic() if now is None else now
+        h = hash(key)
+        ti, tj = self._refill(h & self._mask, now), self._refill((h >> 32) & self._mask, now)
+        best = ti if ti > tj else tj
+        if best < cost:
+            return (cost - best) / self.rate if self.rate > 0 else float("inf")
+        return 0.0
+
+    def acquire(self, key, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Charges `cost` tokens to `key`. Returns 0.0 if allowed, otherwise the
+        seconds until enough tokens are back (for Retry-After)."""
+        now = time.monotonic() if now is None else now
+        h = hash(key)
+        i, j = h & self._mask, (h >> 32) & self._mask
+        ti, tj = self._refill(i, now), self._refill(j, now)
+        best = ti if ti > tj else tj
+        if best < cost:
+            return (cost - best) / self.rate if self.rate > 0 else float("inf")
+        self._tokens[i] = ti - cost if ti > cost else 0.0
+        self._stamps[i] = now
+        self._tokens[j] = tj - cost if tj > cost else 0.0
+        self._stamps[j] = now
+        return 0.0
+
+
+class AdmissionControl:
+    """ASGI middleware that rejects work before the request body is parsed.
+
+    For the paths in `paths`, in order:
+      503  more than `max_concurrent` of these requests are already in flight
+      429  the x-api-key header's token bucket is empty
+      413  the body is larger than `max_body_bytes`
+    Rejections carry Retry-After and are counted in scam_admission_rejected_total.
+    Only the keys in `api_keys` get a bucket of their own. Every other header
+    value (or none) shares one bucket, so junk keys cannot drain a real key's
+    slots; the handler still answers them 401. Per-session limits need the
+    parsed sessionId, so the handlers charge a separate TokenBuckets
+    themselves right after parsing.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_concurrent: int, max_body_bytes: int,
+                 key_buckets: TokenBuckets, api_keys: Iterable[bytes]):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_concurrent = max_concurrent
+        self.max_body_bytes = max_body_bytes
+        self.key_buckets = key_buckets
+        self.api_keys = frozenset(api_keys)
+        self.in_flight = 0  # only touched on the event loop
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        if self.in_flight >= self.max_concurrent:
+            return await _reject(send, 503, "overloaded", "Server busy, retry shortly", 1.0)
+
+        api_key = content_length = None
+        for name, value in scope["headers"]:
+            if name == b"x-api-key":
+                api_key = value
+            elif name == b"content-length":
+                content_length = value
+        wait = self.key_buckets.acquire(api_key if api_key in self.api_keys else None)
+        if wait:
+            return await _reject(send, 429, "api_key_rate", "Rate limit exceeded for this API key", wait)
+
+        if content_length is not None:
+            try:
+                too_large = int(content_length) > self.max_body_bytes
+            except ValueError:
+                too_large = True
+            if too_large:
+                return await _reject(send, 413, "body_size", f"Body larger than {self.max_body_bytes} bytes")
+        else:
+            # Chunked upload: read it here, up to the cap, and replay it to the app.
+            body = bytearray()
+            more = True
+            while more:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return
+                body += message.get("body", b"")
+                more = message.get("more_body", False)
+                if len(body) > self.max_body_bytes:
+                    return await _reject(send, 413, "body_size", f"Body larger than {self.max_body_bytes} bytes")
+            receive = _replay(bytes(body), receive)
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+
+def _replay(body: bytes, receive):
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    return replay
+
+
+async def _reject(send, status: int, reason: str, detail: str, retry_after: Optional[float] = None):
+    REJECTED.inc(reason)
+    headers = [(b"content-type", b"application/json")]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(max(1, int(retry_after + 0.999))).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
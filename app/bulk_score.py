@@ -0,0 +1,227 @@
+"""Offline re-scoring of archived traffic.
+
+    python -m app.bulk_score IN.jsonl OUT.jsonl [--workers N] [--rules FILE]
+
+IN holds one AnalysisRequest payload per line ("-" reads stdin). OUT gets
+one result per non-blank input line, in input order ("-" writes stdout).
+Lines that are not valid payloads get an {"error": ...} record and make
+the exit status 1.
+
+A regular input file is memory-mapped and cut into chunks at newline
+boundaries. Workers receive (offset, length) pairs and read their slice
+from their own mapping, so input bytes never go through the pool's pipes.
+At most `workers * IN_FLIGHT_PER_WORKER` chunks are outstanding at once,
+which bounds memory on multi-GB files. Each worker keeps a DetectionCache,
+since archived campaigns repeat the same text many times.
+"""
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app import rules
+from app.cache import DetectionCache
+from app.detector import detect_scam_signals
+
+SCAM_THRESHOLD = 60  # same cut-off as /analyze-scam (score > 60)
+DEFAULT_CHUNK_BYTES = 4 * 1024 * 1024
+IN_FLIGHT_PER_WORKER = 4
+PROGRESS_INTERVAL = 1.0  # seconds between progress lines
+
+# --- WORKER ---
+_worker_cache: Optional[DetectionCache] = None
+_worker_map: Optional[mmap.mmap] = None
+
+
+def _init_worker(input_path: Optional[str], rules_path: Optional[str], cache_entries: int):
+    global _worker_cache, _worker_map
+    if rules_path:
+        rules.reload(rules_path)
+    _worker_cache = DetectionCache(max_entries=cache_entries) if cache_entries else None
+    if input_path:
+        with open(input_path, "rb") as f:
+            _worker_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def score_line(line: bytes) -> Dict:
+    """Result record for one JSONL line. Bad lines yield an "error" record
+    instead of stopping the run, so output stays aligned with input."""
+    try:
+        payload = json.loads(line)
+        message = payload["message"]
+        text = message["text"]
+        if not isinstance(text, str):
+            raise TypeError("message.text must be a string")
+    except (ValueError, KeyError, TypeError) as e:
+        return {"sessionId": None, "error": f"{type(e).__name__}: {e}"}
+
+    detect = _worker_cache.detect if _worker_cache is not None else detect_scam_signals
+    result = detect(text)
+    score = result["confidence"]
+    return {
+        "sessionId": payload.get("sessionId"),
+        "timestamp": message.get("timestamp"),
+        "is_scam": score > SCAM_THRESHOLD,
+        "confidence_score": score,
+        "suspicious_keywords": result["suspicious_keywords"],
+        "categories": result["categories"],
+        "extracted_intelligence": result["extracted_data"],
+    }
+
+
+def _score_lines(lines: List[bytes]) -> Tuple[bytes, int, int]:
+    out = []
+    errors = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        record = score_line(line)
+        errors += "error" in record
+        out.append(json.dumps(record, ensure_ascii=False))
+    data = ("\n".join(out) + "\n").encode("utf-8", "surrogatepass") if out else b""
+    return data, len(out), errors
+
+
+def _score_span(span: Tuple[int, int]) -> Tuple[bytes, int, int]:
+    start, end = span
+    return _score_lines(_worker_map[start:end].split(b"\n"))
+
+
+# --- INPUT ---
+def _file_spans(mm: mmap.mmap, chunk_bytes: int) -> Iterator[Tuple[int, int]]:
+    """(start, end) byte ranges of about chunk_bytes, each ending after a newline."""
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = mm.find(b"\n", min(start + chunk_bytes, size) - 1)
+        end = size if end < 0 else end + 1
+        yield start, end
+        start = end
+
+
+def _stream_batches(stream, chunk_bytes: int) -> Iterator[List[bytes]]:
+    batch, size = [], 0
+    for line in stream:
+        batch.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+# --- DRIVER ---
+class _Progress:
+    def __init__(self, total_bytes: Optional[int], out):
+        self.total_bytes = total_bytes
+        self.out = out
+        self.started = time.monotonic()
+        self.last = self.started
+        self.bytes = 0
+        self.messages = 0
+        self.errors = 0
+        self.reported = -1
+
+    def update(self, nbytes: int, messages: int, errors: int, final: bool = False):
+        self.bytes += nbytes
+        self.messages += messages
+        self.errors += errors
+        now = time.monotonic()
+        if final and self.reported == self.messages:
+            return
+        if not final and now - self.last < PROGRESS_INTERVAL:
+            return
+        self.last = now
+        self.reported = self.messages
+        elapsed = max(now - self.started, 1e-9)
+        done = f"{self.bytes / self.total_bytes:6.1%} " if self.total_bytes else ""
+        print(f"{done}{self.messages} messages, {self.errors} errors, "
+              f"{self.messages / elapsed:,.0f} msg/s, {self.bytes / elapsed / 1e6:.1f} MB/s, {elapsed:.1f}s",
+              file=self.out, flush=True)
+
+
+def run(input_path: str, output_path: str, workers: int = 0, chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+        rules_path: Optional[str] = None, cache_entries: int = 100_000, progress=sys.stderr) -> Dict:
+    """Scores every line of input_path into output_path. Returns the final counts."""
+    workers = workers or os.cpu_count() or 1
+    if rules_path:
+        rules.load_rules(rules_path)  # fail here, not in every worker's initializer
+    from_file = input_path != "-"
+    mm = None
+    if from_file:
+        with open(input_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        tasks = ((_score_span, span, span[1] - span[0]) for span in (_file_spans(mm, chunk_bytes) if mm else ()))
+        total = size
+    else:
+        stdin = sys.stdin.buffer
+        tasks = ((_score_lines, batch, sum(map(len, batch))) for batch in _stream_batches(stdin, chunk_bytes))
+        total = None
+
+    out = sys.stdout.buffer if output_path == "-" else open(output_path, "wb")
+    meter = _Progress(total, progress) if progress else None
+    initargs = (input_path if mm else None, rules_path, cache_entries)
+    messages = errors = 0
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            # Submit ahead by a fixed window and collect strictly in order:
+            # output order matches input and memory stays bounded.
+            window = deque()
+            max_in_flight = workers * IN_FLIGHT_PER_WORKER
+            for fn, arg, nbytes in tasks:
+                window.append((pool.apply_async(fn, (arg,)), nbytes))
+                if len(window) >= max_in_flight:
+                    messages, errors = _drain_one(window, out, meter, messages, errors)
+            while window:
+                messages, errors = _drain_one(window, out, meter, messages, errors)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        else:
+            out.flush()
+        if mm is not None:
+            mm.close()
+    if meter:
+        meter.update(0, 0, 0, final=True)
+    return {"messages": messages, "errors": errors}
+
+
+def _drain_one(window: deque, out, meter: Optional[_Progress], messages: int, errors: int) -> Tuple[int, int]:
+    result, nbytes = window.popleft()
+    data, count, bad = result.get()
+    out.write(data)
+    if meter:
+        meter.update(nbytes, count, bad)
+    return messages + count, errors + bad
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL of AnalysisRequest payloads, or - for stdin")
+    parser.add_argument("output", help="JSONL results in input order, or - for stdout")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-bytes", type=int, default=DEFAULT_CHUNK_BYTES, help="input bytes per task")
+    parser.add_argument("--rules", help="score with this rules file instead of the active one")
+    parser.add_argument("--cache-entries", type=int, default=100_000,
+                        help="per-worker detection cache size, 0 to disable")
+    parser.add_argument("--quiet", action="store_true", help="no progress output")
+    args = parser.parse_args(argv)
+
+    try:
+        counts = run(args.input, args.output, args.workers, args.chunk_bytes, args.rules,
+                     args.cache_entries, None if args.quiet else sys.stderr)
+    except (OSError, rules.RulesError) as e:
+        print(f"bulk_score: {e}", file=sys.stderr)
+        return 2
+    return 1 if counts["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
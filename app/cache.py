@@ -0,0 +1,166 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.detector import detect_normalized, detect_normalized_batch, normalize_message
+from app.normalize import NormalizedText
+
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+_ENTRY_OVERHEAD = 400  # dict slot, key digest, tuples; a rough per-entry cost
+
+
+def raw_key(message: str) -> bytes:
+    """Key for a message as received, before normalization. Used for large
+    messages, which are only normalized in the process pool. A separate key
+    space from NormalizedText.key()."""
+    return hashlib.blake2b(message.encode("utf-8", "surrogatepass"), digest_size=16, person=b"raw").digest()
+
+
+def freeze_result(result: Dict) -> Tuple:
+    extracted = result.get("extracted_data") or {}
+    return (
+        result["confidence"],
+        tuple(result["suspicious_keywords"]),
+        tuple((field, tuple(values)) for field, values in extracted.items()),
+        tuple(result.get("categories", ())),
+    )
+
+
+def thaw_result(entry: Tuple) -> Dict:
+    # Fresh containers on every hit: callers may mutate what they get back.
+    confidence, keywords, extracted, categories = entry
+    return {
+        "confidence": confidence,
+        "suspicious_keywords": list(keywords),
+        "extracted_data": {field: list(values) for field, values in extracted},
+        "categories": list(categories),
+    }
+
+
+def _entry_size(entry: Tuple) -> int:
+    _, keywords, extracted, categories = entry
+    size = _ENTRY_OVERHEAD + sum(len(k) + 50 for k in keywords) + 60 * len(categories)
+    for _, values in extracted:
+        size += 60 + sum(len(v) + 50 for v in values)
+    return size
+
+
+class DetectionCache:
+    """LRU cache of detect_scam_signals results keyed by message content.
+
+    Scam campaigns send the same text to many recipients. Entries are
+    stored frozen and every hit returns new lists and dicts, so a caller
+    mutating its result cannot corrupt the cache.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 detector: Callable[[NormalizedText], Dict] = detect_normalized,
+                 batch_detector: Callable[[List[NormalizedText]], List[Dict]] = detect_normalized_batch):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.detector = detector
+        self.batch_detector = batch_detector
+        self._entries: "OrderedDict[bytes, Tuple[Tuple, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0  # bumped by clear(); puts from an older generation are dropped
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: bytes) -> Optional[Dict]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return thaw_result(item[0])
+
+    def put(self, key: bytes, result: Dict, generation: Optional[int] = None):
+        entry = freeze_result(result)
+        size = _entry_size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return  # computed before clear(), e.g. with replaced rules
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (entry, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def detect(self, message: str) -> Dict:
+        """detect_scam_signals with caching. Always returns a caller-owned copy."""
+        return self.detect_normalized(normalize_message(message))
+
+    def detect_normalized(self, normalized: NormalizedText, keywords: Optional[Tuple[str, ...]] = None) -> Dict:
+        """`keywords`, if given, go to the detector on a miss (see
+        detector.detect_normalized)."""
+        if not normalized.text:
+            return self.detector(normalized)
+        key = normalized.key()
+        generation = self.generation
+        result = self.get(key)
+        if result is None:
+            result = self.detector(normalized) if keywords is None else self.detector(normalized, keywords=keywords)
+            self.put(key, result, generation)
+        return result
+
+    def detect_normalized_batch(self, batch: List[NormalizedText]) -> List[Dict]:
+        """detect_normalized for many messages. Hits are served from the
+        cache; the misses, each distinct message once, are scored together
+        by `batch_detector`. Every result is a caller-owned copy."""
+        generation = self.generation
+        results: List[Optional[Dict]] = [None] * len(batch)
+        misses: "OrderedDict[Optional[bytes], List[int]]" = OrderedDict()
+        for i, normalized in enumerate(batch):
+            if not normalized.text:
+                misses.setdefault(None, []).append(i)  # never cached, as in detect_normalized
+                continue
+            key = normalized.key()
+            if key in misses:
+                misses[key].append(i)
+                continue
+            results[i] = self.get(key)
+            if results[i] is None:
+                misses[key] = [i]
+        if misses:
+            scored = self.batch_detector([batch[indices[0]] for indices in misses.values()])
+            for (key, indices), result in zip(misses.items(), scored):
+                if key is not None:
+                    self.put(key, result, generation)
+                results[indices[0]] = result
+                for i in indices[1:]:
+                    results[i] = thaw_result(freeze_result(result))
+        return results
+
+    def clear(self):
+        """Drops every entry, e.g. after the detection rules change."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.generation += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "approx_bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,29 +1,401 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from app import worker_slot
+from app.outbox import CallbackOutbox
+
+logger = logging.getLogger(__name__)
 
 GUVI_CALLBACK_URL = "https://hackathon.guvi.in/api/updateHoneyPotFinalResult"
+DEFAULT_AGENT_NOTES = "Scam intent detected via heuristic engine. Autonomous agent engaged to extract intelligence."
 
 
-def send_final_callback(
-    session_id: str,
-    scam_detected: bool,
-    total_messages: int,
-    extracted: dict
-):
-    payload = {
+def build_callback_payload(session_id: str, is_scam: bool, msg_count: int, intelligence: Dict,
+                           agent_notes: str = DEFAULT_AGENT_NOTES) -> Dict:
+    """The final report format expected by GUVI."""
+    return {
         "sessionId": session_id,
-        "scamDetected": scam_detected,
-        "totalMessagesExchanged": total_messages,
+        "scamDetected": is_scam,
+        "totalMessagesExchanged": msg_count,
         "extractedIntelligence": {
-            "bankAccounts": [],
-            "upiIds": [extracted.get("upi_id")] if extracted.get("upi_id") else [],
-            "phishingLinks": [extracted.get("phishing_link")] if extracted.get("phishing_link") else [],
-            "phoneNumbers": [extracted.get("phone_number")] if extracted.get("phone_number") else [],
-            "suspiciousKeywords": extracted.get("suspicious_keywords", [])
+            "bankAccounts": intelligence.get("bankAccounts", []),
+            "upiIds": intelligence.get("upiIds", []),
+            "phishingLinks": intelligence.get("phishingLinks", []),
+            "phoneNumbers": intelligence.get("phoneNumbers", []),
+            "suspiciousKeywords": intelligence.get("suspiciousKeywords", [])
         },
-        "agentNotes": "Scammer used urgency and payment redirection tactics"
+        "agentNotes": agent_notes
     }
 
-    try:
-        requests.post(GUVI_CALLBACK_URL, json=payload, timeout=5)
-    except Exception as e:
-        print("Callback failed:", e)
+
+class CallbackDispatcher:
+    """Delivers callbacks from an asyncio queue over one keep-alive pool.
+
+    `concurrency` workers drain the queue, so at most that many POSTs are
+    in flight. Failed deliveries (network errors, 429 and 5xx) are retried
+    with full-jitter exponential backoff. `submit` is safe to call from the
+    FastAPI threadpool.
+
+    With `outbox_dir` set, every callback is written to a CallbackOutbox
+    before it is queued and acked once delivered. Whatever was not acked
+    (worker restart, retries exhausted) is replayed on the next start().
+    Each worker process gets its own outbox, the slot of `outbox_dir` it
+    claims (see app.worker_slot). start() also adopts the outboxes of slots
+    no live worker holds, so their callbacks are replayed too.
+    """
+
+    def __init__(self, url: str = GUVI_CALLBACK_URL, concurrency: int = 4, max_queue: int = 10_000,
+                 timeout: float = 5, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_cap: float = 10.0, outbox_dir: Optional[str] = None):
+        self.url = url
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.outbox_dir = outbox_dir
+        self.outbox: Optional[CallbackOutbox] = None
+        self._slot: Optional[worker_slot.WorkerSlot] = None
+
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._replay_task: Optional[asyncio.Task] = None
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1024)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.replayed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        if self.outbox_dir:
+            self._slot = worker_slot.claim(self.outbox_dir)
+            self.outbox = CallbackOutbox(self._slot.path)
+            self._adopt_orphans()
+            self.outbox.compact()
+            # Only records from earlier runs; new submits are queued directly.
+            self._replay_task = asyncio.create_task(self._replay(self.outbox.next_id))
+
+    def _adopt_orphans(self):
+        for slot in worker_slot.existing_slots(self.outbox_dir):
+            if slot == self._slot.slot:
+                continue
+            orphan_slot = worker_slot.try_claim(self.outbox_dir, slot)
+            if orphan_slot is None:
+                continue  # a live worker's
+            try:
+                orphan = CallbackOutbox(orphan_slot.path)
+                try:
+                    adopted = self.outbox.adopt(orphan)
+                finally:
+                    orphan.close()
+            except Exception as e:
+                logger.error(f"Outbox {orphan_slot.path} not adopted: {e}")
+                continue
+            finally:
+                orphan_slot.release()
+            if adopted:
+                logger.info(f"Adopted {adopted} callbacks from outbox {orphan_slot.path}")
+
+    async def _replay(self, before_id: int):
+        """Resends callbacks left unacked by a previous run."""
+        for record_id, payload in self.outbox.pending(before_id):
+            await self._queue.put((payload, time.monotonic(), record_id))
+            self.replayed += 1
+        if self.replayed:
+            logger.info(f"Replayed {self.replayed} callbacks from outbox")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Drains pending callbacks (up to drain_timeout) and stops the workers."""
+        if not self.running:
+            return
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Callback queue not drained on shutdown: {self._queue.qsize()} pending")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._http.close()
+        if self.outbox is not None:
+            # Anything still unacked stays on disk for the next start().
+            self.outbox.compact()
+            self.outbox.close()
+            self.outbox = None
+            self._slot.release()
+            self._slot = None
+
+    def submit(self, payload: Dict) -> bool:
+        """Queues a callback. Returns False if it was dropped."""
+        if not self.running:
+            # No event loop yet (e.g. app used without lifespan): send inline.
+            return self._deliver_sync(payload)
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        record_id = self.outbox.append(payload) if self.outbox is not None else None
+        if running_loop is self._loop:
+            return self._enqueue(payload, record_id)
+        self._loop.call_soon_threadsafe(self._enqueue, payload, record_id)
+        return True
+
+    def _enqueue(self, payload: Dict, record_id: Optional[int] = None) -> bool:
+        try:
+            self._queue.put_nowait((payload, time.monotonic(), record_id))
+            return True
+        except asyncio.QueueFull:
+            with self._stats_lock:
+                self.dropped += 1
+            # A callback already in the outbox is not lost, just delayed to the next start.
+            logger.error(f"Callback queue full, dropped callback for {payload.get('sessionId')}")
+            return False
+
+    async def _worker(self):
+        while True:
+            payload, queued_at, record_id = await self._queue.get()
+            try:
+                if await self._deliver(payload, queued_at) and record_id is not None:
+                    self.outbox.ack(record_id)
+            except Exception as e:
+                logger.error(f"Callback worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _post(self, payload: Dict) -> bool:
+        response = self._http.post(self.url, json=payload, timeout=self.timeout)
+        logger.info(f"GUVI Callback Sent: {response.status_code} | {response.text}")
+        if response.status_code == 429 or response.status_code >= 500:
+            return False
+        return True
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    async def _deliver(self, payload: Dict, queued_at: float) -> bool:
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self._stats_lock:
+                    self.retried += 1
+                await asyncio.sleep(self._backoff(attempt - 1))
+            try:
+                ok = await self._loop.run_in_executor(None, self._post, payload)
+            except Exception as e:
+                logger.error(f"Failed to send GUVI callback: {e}")
+                ok = False
+            if ok:
+                self._record(True, queued_at)
+                return True
+        self._record(False, queued_at)
+        return False
+
+    def _deliver_sync(self, payload: Dict) -> bool:
+        started = time.monotonic()
+        try:
+            ok = self._post(payload)
+        except Exception as e:
+            logger.error(f"Failed to send GUVI callback: {e}")
+            ok = False
+        self._record(ok, started)
+        return ok
+
+    def _record(self, ok: bool, queued_at: float):
+        with self._stats_lock:
+            self._latencies.append(time.monotonic() - queued_at)
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    def stats(self) -> Dict:
+        """Queue depth, outcome counters and enqueue-to-done latency (seconds)."""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": self.retried,
+                "dropped": self.dropped,
+                "replayed": self.replayed,
+            }
+        if self.outbox is not None:
+            stats["outbox"] = self.outbox.backlog()
+        if latencies:
+            stats["latency_p50"] = latencies[len(latencies) // 2]
+            stats["latency_p99"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        else:
+            stats["latency_p50"] = stats["latency_p99"] = 0.0
+        return stats
+
+
+INTEL_FIELDS = ("bankAccounts", "upiIds", "phishingLinks", "phoneNumbers", "suspiciousKeywords")
+
+
+class _PendingReport:
+    __slots__ = ("msg_count", "turns", "last_update", "intel", "campaigns")
+
+    def __init__(self):
+        self.msg_count = 0
+        self.turns = 0
+        self.last_update = 0.0
+        self.intel: Dict[str, Dict[str, None]] = {f: {} for f in INTEL_FIELDS}
+        self.campaigns: Dict[str, None] = {}
+
+    def agent_notes(self) -> str:
+        if not self.campaigns:
+            return DEFAULT_AGENT_NOTES
+        return f"{DEFAULT_AGENT_NOTES} Campaign: {', '.join(self.campaigns)}."
+
+
+class CallbackCoalescer:
+    """Sends one callback per session instead of one per scam message.
+
+    Each offer() merges that turn's intelligence into a pending report for the
+    session. The report is submitted to the dispatcher once the session has
+    been quiet for `quiet_period` seconds, or right away after `max_messages`
+    offers. Reports carry the union of everything offered so far.
+
+    With several worker processes, pass `claim(session_id, msg_count)` (e.g.
+    SharedSessionStore.claim_report). A report is only sent if claim()
+    returns True, so workers do not repeat a report another one already sent.
+    """
+
+    def __init__(self, dispatcher: CallbackDispatcher, quiet_period: float = 10.0, max_messages: int = 10,
+                 claim: Optional[Callable[[str, int], bool]] = None):
+        self.dispatcher = dispatcher
+        self.quiet_period = quiet_period
+        self.max_messages = max_messages
+        self.claim = claim
+        self._lock = threading.Lock()
+        # Ordered by last update, so sessions that went quiet are at the front.
+        self._pending: "OrderedDict[str, _PendingReport]" = OrderedDict()
+        self._ticker: Optional[asyncio.Task] = None
+        self.offered = 0
+        self.flushed = 0
+        self.deduped = 0
+
+    async def start(self):
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._tick())
+
+    async def stop(self):
+        """Flushes every pending report. Call before stopping the dispatcher."""
+        if self._ticker is not None:
+            self._ticker.cancel()
+            await asyncio.gather(self._ticker, return_exceptions=True)
+            self._ticker = None
+        if self.claim is not None:
+            await asyncio.to_thread(self.flush_all)
+        else:
+            self.flush_all()
+
+    def offer(self, session_id: str, msg_count: int, intelligence: Dict, campaign_id: Optional[str] = None):
+        with self._lock:
+            self.offered += 1
+            report = self._pending.get(session_id)
+            if report is None:
+                report = self._pending[session_id] = _PendingReport()
+            else:
+                self._pending.move_to_end(session_id)
+            report.msg_count = max(report.msg_count, msg_count)
+            report.turns += 1
+            report.last_update = time.monotonic()
+            if campaign_id:
+                report.campaigns[campaign_id] = None
+            for field in INTEL_FIELDS:
+                merged = report.intel[field]
+                for value in intelligence.get(field, []):
+                    merged[value] = None
+            if self._ticker is not None and report.turns < self.max_messages:
+                return
+            del self._pending[session_id]
+        self._send(session_id, report)
+
+    def _send(self, session_id: str, report: _PendingReport):
+        if self.claim is not None:
+            try:
+                claimed = self.claim(session_id, report.msg_count)
+            except Exception as e:
+                # Better a duplicate report than a lost one
+                logger.error(f"Callback claim failed for {session_id}, sending anyway: {e}")
+                claimed = True
+            if not claimed:
+                with self._lock:
+                    self.deduped += 1
+                return
+        intel = {field: list(values) for field, values in report.intel.items()}
+        self.dispatcher.submit(build_callback_payload(session_id, True, report.msg_count, intel,
+                                                      report.agent_notes()))
+        with self._lock:
+            self.flushed += 1
+
+    def flush_due(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._lock:
+            while self._pending:
+                session_id, report = next(iter(self._pending.items()))
+                if now - report.last_update < self.quiet_period:
+                    break
+                del self._pending[session_id]
+                due.append((session_id, report))
+        for session_id, report in due:
+            self._send(session_id, report)
+
+    def flush_all(self):
+        with self._lock:
+            due = list(self._pending.items())
+            self._pending.clear()
+        for session_id, report in due:
+            self._send(session_id, report)
+
+    async def _tick(self):
+        interval = min(1.0, self.quiet_period / 4)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.claim is not None:
+                    # claim() may block on a shared database; not on the event loop.
+                    await asyncio.to_thread(self.flush_due)
+                else:
+                    self.flush_due()
+            except Exception as e:
+                logger.error(f"Callback coalescer error: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "pending_sessions": len(self._pending),
+                "offered": self.offered,
+                "flushed": self.flushed,
+                "deduped": self.deduped,
+            }
@@ -0,0 +1,186 @@
+import hashlib
+import heapq
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# --- SIGNATURE PARAMETERS ---
+# One-permutation MinHash: every shingle is hashed once and lands in one of
+# NUM_BINS bins, keeping the minimum per bin. Bins are grouped into bands for
+# LSH; two messages become candidates when any band matches exactly.
+NUM_BINS = 32
+ROWS_PER_BAND = 2
+SHINGLE_WORDS = 2
+MAX_SIGNATURE_CHARS = 1024  # campaign templates are SMS-sized; bound the work on huge messages
+DEFAULT_THRESHOLD = 0.4     # estimated Jaccard similarity to join a campaign
+MAX_BUCKET_SIZE = 8         # most recent campaigns kept per band value; bounds candidates
+MAX_CANDIDATES = 4          # candidates scored per message, most shared bands first
+DEFAULT_MAX_CAMPAIGNS = 20_000
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+_EMPTY = 1 << 32
+_BIN_MASK = NUM_BINS - 1
+
+# Scammers rotate the payee between sends; mask indicators so the template matches.
+_MASKS = [
+    (re.compile(r'https?://\S+|www\.\S+'), " _link_ "),
+    (re.compile(r'[a-z0-9._\-]+@[a-z]+'), " _upi_ "),
+    (re.compile(r'\d+'), " _num_ "),
+]
+_WORD = re.compile(r'\w+')
+
+
+def signature(text: str) -> Tuple[int, ...]:
+    """MinHash signature of the message's word shingles (NUM_BINS values).
+    `text` is the normalized view (NormalizedText.text), so spacing, width
+    and lookalike variants of one template get the same shingles."""
+    text = text[:MAX_SIGNATURE_CHARS].lower()
+    for pattern, token in _MASKS:
+        text = pattern.sub(token, text)
+    words = _WORD.findall(text)
+    if len(words) < SHINGLE_WORDS:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+
+    mins = [_EMPTY] * NUM_BINS
+    for shingle in shingles:
+        h = zlib.crc32(shingle.encode("utf-8", "surrogatepass"))
+        b = h & _BIN_MASK
+        if h < mins[b]:
+            mins[b] = h
+    return tuple(mins)
+
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity, ignoring bins empty in both signatures."""
+    used = equal = 0
+    for x, y in zip(a, b):
+        if x == _EMPTY and y == _EMPTY:
+            continue
+        used += 1
+        if x == y:
+            equal += 1
+    return equal / used if used else 0.0
+
+
+def _bands(sig: Tuple[int, ...]) -> List[Tuple]:
+    # Bands made only of empty bins would pair up every short message; skip them.
+    bands = []
+    for i in range(0, NUM_BINS, ROWS_PER_BAND):
+        rows = sig[i:i + ROWS_PER_BAND]
+        if any(v != _EMPTY for v in rows):
+            bands.append((i,) + rows)
+    return bands
+
+
+class Campaign:
+    __slots__ = ("campaign_id", "signature", "members", "first_seen", "last_seen", "representative")
+
+    def __init__(self, campaign_id: str, sig: Tuple[int, ...], ts: float):
+        self.campaign_id = campaign_id
+        self.signature = sig
+        self.members = 0
+        self.first_seen = ts
+        self.last_seen = ts
+        # (rules version, keywords) of the first member scored, reused for
+        # the keyword hits of later members (see detector.detect_normalized)
+        self.representative: Optional[Tuple[str, Tuple[str, ...]]] = None
+
+    def representative_keywords(self, version: str) -> Optional[Tuple[str, ...]]:
+        """The representative's keywords, if it was scored under rules `version`."""
+        representative = self.representative
+        if representative is None or representative[0] != version:
+            return None
+        return representative[1]
+
+    def set_representative(self, version: str, result: Dict):
+        if self.representative_keywords(version) is None:
+            self.representative = (version, tuple(result["suspicious_keywords"]))
+
+
+class CampaignIndex:
+    """Streaming near-duplicate index that assigns each message a campaign ID.
+
+    Memory is bounded by `max_campaigns` (least recently seen evicted first)
+    and by `ttl_seconds` of inactivity.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_campaigns: int = DEFAULT_MAX_CAMPAIGNS,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_campaigns = max_campaigns
+        self.ttl_seconds = ttl_seconds
+        self._campaigns: "OrderedDict[str, Campaign]" = OrderedDict()
+        self._buckets: Dict[Tuple, Dict[str, None]] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._campaigns)
+
+    def get(self, campaign_id: str) -> Optional[Campaign]:
+        return self._campaigns.get(campaign_id)
+
+    def assign(self, text: str) -> Optional[Campaign]:
+        """Returns the campaign for the normalized `text`, creating one if
+        nothing is close enough."""
+        if not text:
+            return None
+        sig = signature(text)
+        if all(v == _EMPTY for v in sig):
+            return None
+        bands = _bands(sig)
+        now = time.monotonic()
+        with self._lock:
+            # Shared band count ranks candidates; only the top few get a full comparison.
+            hits: Dict[str, int] = {}
+            for band in bands:
+                for campaign_id in self._buckets.get(band, ()):
+                    hits[campaign_id] = hits.get(campaign_id, 0) + 1
+            best, best_sim = None, 0.0
+            for campaign_id in heapq.nlargest(MAX_CANDIDATES, hits, key=hits.__getitem__):
+                sim = similarity(sig, self._campaigns[campaign_id].signature)
+                if sim > best_sim:
+                    best, best_sim = self._campaigns[campaign_id], sim
+
+            if best is None or best_sim < self.threshold:
+                digest = hashlib.blake2b(repr(sig).encode(), digest_size=6).hexdigest()
+                best = self._campaigns.get(f"cmp-{digest}")
+                if best is None:
+                    best = Campaign(f"cmp-{digest}", sig, now)
+                    self._campaigns[best.campaign_id] = best
+                    for band in bands:
+                        members = self._buckets.setdefault(band, {})
+                        members[best.campaign_id] = None
+                        if len(members) > MAX_BUCKET_SIZE:
+                            # Common phrases ("your account") land in crowded buckets;
+                            # the campaign is still reachable through its other bands.
+                            del members[next(iter(members))]
+
+            best.members += 1
+            best.last_seen = now
+            self._campaigns.move_to_end(best.campaign_id)
+            self._evict(now)
+            return best
+
+    def _evict(self, now: float):
+        while self._campaigns:
+            campaign_id, campaign = next(iter(self._campaigns.items()))
+            if len(self._campaigns) <= self.max_campaigns and now - campaign.last_seen <= self.ttl_seconds:
+                break
+            del self._campaigns[campaign_id]
+            for band in _bands(campaign.signature):
+                members = self._buckets.get(band)
+                if members is not None:
+                    members.pop(campaign_id, None)
+                    if not members:
+                        del self._buckets[band]
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"campaigns": len(self._campaigns), "buckets": len(self._buckets), "evictions": self.evictions}
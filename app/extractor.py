@@ -1,16 +1,129 @@
 import re
+from typing import Dict, List, Optional, Tuple
+
+# --- LIMITS ---
+# Only the first MAX_SCAN_CHARS of a message are scanned, at most
+# MAX_ITEMS_PER_FIELD distinct values (MAX_MATCHES_PER_FIELD raw matches) are
+# kept per field, and single values are length-capped. Together these bound
+# the work per message.
+MAX_SCAN_CHARS = 1024 * 1024
+MAX_ITEMS_PER_FIELD = 50
+MAX_MATCHES_PER_FIELD = 1000
+MAX_UPI_LOCAL = 256
+MAX_UPI_HANDLE = 64
+MAX_LINK_CHARS = 2048
+
+# --- PRECOMPILED SCANNERS ---
+# UPI IDs are found from each "@handle" backwards instead of trying a regex
+# at every offset, so long runs of word characters with no "@" cost O(n).
+_UPI_LOCAL_REV = re.compile(r'[a-zA-Z0-9._\-]{2,%d}' % MAX_UPI_LOCAL)
+_UPI_AT_HANDLE = re.compile(r'@[a-zA-Z]{2,%d}' % MAX_UPI_HANDLE)
+# Digit lookarounds keep phone numbers from being carved out of longer
+# numbers; every attempt is fixed-width, so the scan is linear. Each pattern
+# starts with a literal or character class (the lookbehinds come after the
+# first character) so re can skip ahead with its fast prefix search.
+_PHONE = re.compile(r'(?:\+(?<!\d\+)91[\-\s]?[6-9]|[6-9](?<!\d\d))\d{9}(?!\d)')
+_BANK_AC = re.compile(r'[0-9](?<!\d\d)[0-9]{8,17}(?!\d)')
+_LINK = re.compile(r'https?://\S{1,%d}|www\.\S{1,%d}' % (MAX_LINK_CHARS, MAX_LINK_CHARS))
+
+
+class _Field:
+    """Order-preserving de-dup with the per-field caps."""
+
+    __slots__ = ("values", "matches")
+
+    def __init__(self):
+        self.values: Dict[str, None] = {}
+        self.matches = 0
+
+    def add(self, value: str) -> bool:
+        """Returns False once the field is full."""
+        self.values[value] = None
+        self.matches += 1
+        return len(self.values) < MAX_ITEMS_PER_FIELD and self.matches < MAX_MATCHES_PER_FIELD
+
+
+def _scan_upi(text: str) -> List[str]:
+    found = _Field()
+    if "@" not in text:
+        return []
+    n = len(text)
+    rev = None
+    floor = 0  # matches may not overlap, same as re.findall
+    for handle in _UPI_AT_HANDLE.finditer(text):
+        at = handle.start()
+        if at < floor:
+            continue
+        if rev is None:
+            rev = text[::-1]
+        # Longest allowed run right before "@", read backwards (max 256 chars).
+        local = _UPI_LOCAL_REV.match(rev, n - at, n - floor)
+        if local:
+            floor = handle.end()
+            if not found.add(text[at - len(local.group(0)):floor]):
+                break
+    return list(found.values)
+
+
+def _scan(pattern, text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+    found = _Field()
+    spans = []
+    for m in pattern.finditer(text):
+        spans.append(m.span())
+        if not found.add(m.group(0)):
+            break
+    return list(found.values), spans
+
+
+def extract_intelligence_data(text: str) -> Dict:
+    """UPI IDs, phone numbers, links and bank account numbers in `text`.
+
+    Digit runs already reported as phone numbers are not repeated as bank
+    accounts.
+    """
+    if len(text) > MAX_SCAN_CHARS:
+        text = text[:MAX_SCAN_CHARS]
+
+    phones, phone_spans = _scan(_PHONE, text)
+    links, _ = _scan(_LINK, text)
+
+    accounts = _Field()
+    i = 0
+    for m in _BANK_AC.finditer(text):
+        start, end = m.span()
+        # Phone spans are sorted and non-overlapping; skip the ones behind us.
+        while i < len(phone_spans) and phone_spans[i][1] <= start:
+            i += 1
+        if i < len(phone_spans) and phone_spans[i][0] < end:
+            continue
+        if not accounts.add(m.group(0)):
+            break
+
+    return {
+        "upiIds": _scan_upi(text),
+        "phoneNumbers": phones,
+        "phishingLinks": links,
+        "bankAccounts": list(accounts.values),
+    }
+
+
+# --- SINGLE-VALUE HELPERS ---
+def _first(values: List[str]) -> Optional[str]:
+    return values[0] if values else None
+
 
 def extract_upi_id(text: str):
     # Matches example@upi, 99999@ybl, etc.
-    match = re.search(r"[\w\.\-]+@[\w\.\-]+", text)
-    return match.group(0) if match else None
+    return _first(_scan_upi(text[:MAX_SCAN_CHARS]))
+
 
 def extract_phone_number(text: str):
     # Matches +91-999... or 9999999999 (India specific)
-    match = re.search(r"(\+91[\-\s]?)?[6-9]\d{9}", text)
-    return match.group(0) if match else None
+    m = _PHONE.search(text, 0, MAX_SCAN_CHARS)
+    return m.group(0) if m else None
+
 
 def extract_phishing_link(text: str):
     # Matches http/https links, avoiding simple text
-    match = re.search(r"https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+\S*", text)
-    return match.group(0) if match else None
\ No newline at end of file
+    m = _LINK.search(text, 0, MAX_SCAN_CHARS)
+    return m.group(0) if m else None
@@ -0,0 +1,402 @@
+import heapq
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from app.session import INTEL_FIELDS
+
+logger = logging.getLogger(__name__)
+
+MAX_SESSIONS_PER_INDICATOR = 100  # most recent sessions kept per indicator
+DEFAULT_MAX_INDICATORS = 1_000_000
+
+# --- SNAPSHOT FORMAT ---
+# All integers little-endian. The file is read through mmap and never fully parsed:
+#   header   magic, version, entry count, offset of the key blob, offset of the
+#            session blob, offset and slot count of the hash table
+#   entries  fixed-size records sorted by key bytes (so snapshots merge in order)
+#   keys     b"<field>\0<normalized value>" for each entry, concatenated
+#   sessions for each entry, its session ids as u16 length + utf-8 bytes
+#   table    open addressing, linear probing: u32 entry index per slot, _EMPTY if
+#            none. A power of two at least twice the entry count, slot = crc32(key).
+# Version 1 files (no table) are still read, with a binary search over the entries.
+SNAPSHOT_MAGIC = b"SCIX"
+SNAPSHOT_VERSION = 2
+_PREFIX = struct.Struct("<4sI")
+_HEADER_V1 = struct.Struct("<4sIQQQ")
+_HEADER = struct.Struct("<4sIQQQQQ")
+_SLOT = struct.Struct("<I")
+_EMPTY = 0xFFFFFFFF
+# key offset, key length, session count, first seen, last seen, hits, session offset
+_ENTRY = struct.Struct("<QIIddQQ")
+_SESSION_LEN = struct.Struct("<H")
+
+_NON_DIGIT = re.compile(r'\D')
+_TRAILING_PUNCT = ".,;:!?)]}'\""
+
+
+# --- NORMALIZATION ---
+def _normalize_phone(value: str) -> str:
+    digits = _NON_DIGIT.sub("", value)
+    # +91 / 0 prefixes: the last ten digits identify an Indian mobile number
+    return digits[-10:] if len(digits) > 10 else digits
+
+
+def _normalize_link(value: str) -> str:
+    value = value.strip().rstrip(_TRAILING_PUNCT)
+    if value.lower().startswith("www."):
+        value = "http://" + value
+    try:
+        parts = urlsplit(value)
+    except ValueError:
+        return value.lower()
+    # Scheme and host are case-insensitive; the path is not.
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"),
+                       parts.query, ""))
+
+
+_NORMALIZERS = {
+    "upiIds": lambda v: v.strip().lower(),
+    "phoneNumbers": _normalize_phone,
+    "phishingLinks": _normalize_link,
+    "bankAccounts": lambda v: _NON_DIGIT.sub("", v),
+}
+
+
+def normalize_indicator(field: str, value: str) -> str:
+    """Canonical form used as the index key, so '+91 98765 43210' and
+    '9876543210' are the same phone number."""
+    return _NORMALIZERS[field](value)
+
+
+def _key(field: str, value: str) -> bytes:
+    return f"{field}\0{value}".encode("utf-8", "surrogatepass")
+
+
+class _Posting:
+    __slots__ = ("first_seen", "last_seen", "hits", "sessions")
+
+    def __init__(self, first_seen: float, last_seen: float, hits: int, sessions: List[str]):
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.hits = hits
+        self.sessions: Dict[str, None] = dict.fromkeys(sessions)  # ordered, oldest first
+
+    def to_dict(self, field: str, value: str) -> Dict:
+        return {
+            "field": field,
+            "indicator": value,
+            "sessions": list(self.sessions),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "hits": self.hits,
+        }
+
+
+class _Snapshot:
+    """Read-only view of a snapshot file. Lookups probe its hash table in the mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = _PREFIX.unpack_from(self._mm, 0)
+        if magic != SNAPSHOT_MAGIC or version not in (1, SNAPSHOT_VERSION):
+            self._mm.close()
+            raise ValueError(f"{path}: not an intel index snapshot (version {SNAPSHOT_VERSION})")
+        if version == 1:
+            _, _, self.count, self._keys_off, self._sessions_off = _HEADER_V1.unpack_from(self._mm, 0)
+            self._entries_off, self._table_off, self._slots = _HEADER_V1.size, 0, 0
+        else:
+            _, _, self.count, self._keys_off, self._sessions_off, self._table_off, self._slots = \
+                _HEADER.unpack_from(self._mm, 0)
+            self._entries_off = _HEADER.size
+
+    def _entry(self, i: int) -> Tuple:
+        return _ENTRY.unpack_from(self._mm, self._entries_off + i * _ENTRY.size)
+
+    def _key_at(self, entry: Tuple) -> bytes:
+        start = self._keys_off + entry[0]
+        return self._mm[start:start + entry[1]]
+
+    def _posting(self, entry: Tuple) -> _Posting:
+        _, _, session_count, first_seen, last_seen, hits, offset = entry
+        pos = self._sessions_off + offset
+        sessions = []
+        for _ in range(session_count):
+            (length,) = _SESSION_LEN.unpack_from(self._mm, pos)
+            pos += _SESSION_LEN.size
+            sessions.append(_decode_session(self._mm[pos:pos + length]))
+            pos += length
+        return _Posting(first_seen, last_seen, hits, sessions)
+
+    def get(self, key: bytes) -> Optional[_Posting]:
+        if not self._slots:
+            return self._search(key)
+        mask = self._slots - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            (i,) = _SLOT.unpack_from(self._mm, self._table_off + slot * _SLOT.size)
+            if i == _EMPTY:
+                return None
+            entry = self._entry(i)
+            if self._key_at(entry) == key:
+                return self._posting(entry)
+            slot = (slot + 1) & mask
+
+    def _search(self, key: bytes) -> Optional[_Posting]:
+        # Version 1 snapshots have no hash table.
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            mid_key = self._key_at(entry)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return self._posting(entry)
+        return None
+
+    def items(self) -> Iterator[Tuple[bytes, _Posting]]:
+        for i in range(self.count):
+            entry = self._entry(i)
+            yield self._key_at(entry), self._posting(entry)
+
+    def close(self):
+        self._mm.close()
+
+
+def _truncate_utf8(raw: bytes, limit: int) -> bytes:
+    # Cut before a continuation byte would split a character in two.
+    if len(raw) <= limit:
+        return raw
+    while limit and raw[limit] & 0xC0 == 0x80:
+        limit -= 1
+    return raw[:limit]
+
+
+def _decode_session(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8", "surrogatepass")
+    except UnicodeDecodeError:
+        # Snapshots written before _truncate_utf8 may end an id mid-character.
+        return raw.decode("utf-8", "replace")
+
+
+def _table_slots(count: int) -> int:
+    # Load factor at most 1/2 keeps linear probe runs short.
+    slots = 1
+    while slots < 2 * count:
+        slots <<= 1
+    return slots
+
+
+def _write_snapshot(path: str, items: List[Tuple[bytes, _Posting]]):
+    """Writes sorted `items` to `path` atomically (temp file + rename)."""
+    keys = bytearray()
+    sessions = bytearray()
+    entries = bytearray()
+    slots = _table_slots(len(items))
+    table = [_EMPTY] * slots
+    mask = slots - 1
+    for i, (key, posting) in enumerate(items):
+        slot = zlib.crc32(key) & mask
+        while table[slot] != _EMPTY:
+            slot = (slot + 1) & mask
+        table[slot] = i
+        session_offset = len(sessions)
+        for session_id in posting.sessions:
+            raw = _truncate_utf8(session_id.encode("utf-8", "surrogatepass"), 0xFFFF)
+            sessions += _SESSION_LEN.pack(len(raw)) + raw
+        entries += _ENTRY.pack(len(keys), len(key), len(posting.sessions), posting.first_seen,
+                               posting.last_seen, posting.hits, session_offset)
+        keys += key
+    keys_off = _HEADER.size + len(entries)
+    sessions_off = keys_off + len(keys)
+    table_off = sessions_off + len(sessions)
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(items), keys_off, sessions_off,
+                          table_off, slots)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(entries)
+        f.write(keys)
+        f.write(sessions)
+        f.write(struct.pack(f"<{slots}I", *table))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class IntelIndex:
+    """Inverted index from normalized indicator (UPI ID, phone, link, bank
+    account) to the sessions that reported it, with first/last seen and hits.
+
+    Two layers: the last snapshot, memory-mapped with an on-disk hash table, and an
+    in-memory dict of indicators seen since. An indicator already in the
+    snapshot is copied into the dict on its first new hit. snapshot() merges
+    both into a new sorted file and swaps it in, so a restart only maps the
+    file instead of rebuilding the index.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_indicators: int = DEFAULT_MAX_INDICATORS):
+        self.path = path
+        self.max_indicators = max_indicators
+        self._recent: "OrderedDict[bytes, _Posting]" = OrderedDict()
+        self._snapshot: Optional[_Snapshot] = None
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()  # one snapshot() at a time
+        self.evictions = 0
+        if path and os.path.exists(path):
+            try:
+                self._snapshot = _Snapshot(path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Intel index snapshot {path} not loaded: {e}")
+
+    def __len__(self) -> int:
+        """Indicators changed since the last snapshot plus those in it (upper bound)."""
+        return len(self._recent) + (self._snapshot.count if self._snapshot else 0)
+
+    def record(self, session_id: str, extracted_data: Dict, ts: Optional[float] = None):
+        """Adds one message's extracted intelligence for `session_id`."""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            for field in INTEL_FIELDS:
+                for value in extracted_data.get(field) or ():
+                    normalized = normalize_indicator(field, value)
+                    if not normalized:
+                        continue
+                    key = _key(field, normalized)
+                    posting = self._recent.get(key)
+                    if posting is None:
+                        posting = self._snapshot.get(key) if self._snapshot else None
+                        if posting is None:
+                            posting = _Posting(ts, ts, 0, [])
+                        self._recent[key] = posting
+                    else:
+                        self._recent.move_to_end(key)
+                    posting.hits += 1
+                    posting.last_seen = ts
+                    posting.sessions.pop(session_id, None)
+                    posting.sessions[session_id] = None
+                    if len(posting.sessions) > MAX_SESSIONS_PER_INDICATOR:
+                        del posting.sessions[next(iter(posting.sessions))]
+            # Past the cap, the least recently seen indicators fall back to
+            # their snapshot values (or are forgotten if never snapshotted).
+            while len(self._recent) > self.max_indicators:
+                self._recent.popitem(last=False)
+                self.evictions += 1
+
+    def lookup(self, value: str, field: Optional[str] = None) -> List[Dict]:
+        """Every indicator matching `value`, in one field or all of them. O(1):
+        a dict lookup, then a probe of the snapshot's hash table."""
+        fields = [field] if field else INTEL_FIELDS
+        matches = []
+        with self._lock:
+            for f in fields:
+                normalized = normalize_indicator(f, value)
+                if not normalized:
+                    continue
+                key = _key(f, normalized)
+                posting = self._recent.get(key)
+                if posting is None and self._snapshot is not None:
+                    posting = self._snapshot.get(key)
+                if posting is not None:
+                    matches.append(posting.to_dict(f, normalized))
+        return matches
+
+    def adopt(self, path: str) -> int:
+        """Merges the snapshot file at `path`, e.g. one left by a worker that
+        is gone, into this index. Returns the number of indicators merged;
+        they are written out by the next snapshot()."""
+        orphan = _Snapshot(path)
+        try:
+            adopted = 0
+            with self._lock:
+                for key, theirs in orphan.items():
+                    ours = self._recent.get(key)
+                    if ours is None and self._snapshot is not None:
+                        ours = self._snapshot.get(key)
+                    if ours is not None:
+                        older, newer = sorted((theirs, ours), key=lambda p: p.last_seen)
+                        sessions = [s for s in older.sessions if s not in newer.sessions] + list(newer.sessions)
+                        theirs = _Posting(min(older.first_seen, newer.first_seen), newer.last_seen,
+                                          older.hits + newer.hits, sessions[-MAX_SESSIONS_PER_INDICATOR:])
+                    self._recent[key] = theirs
+                    adopted += 1
+        finally:
+            orphan.close()
+        return adopted
+
+    def snapshot(self, path: Optional[str] = None) -> int:
+        """Merges recent indicators into a new snapshot file. Returns the entry count.
+
+        Only copying the recent postings holds the lock; the merge and the
+        write run without it, so record() is not blocked for the whole write.
+        """
+        path = path or self.path
+        if not path:
+            raise ValueError("no snapshot path configured")
+        with self._snapshot_lock:
+            with self._lock:
+                copied = {key: _Posting(p.first_seen, p.last_seen, p.hits, list(p.sessions))
+                          for key, p in self._recent.items()}
+                base = self._snapshot
+
+            merged = sorted(copied.items())
+            if base is not None:
+                # The base is already sorted; merge in the entries not superseded.
+                unchanged = ((key, p) for key, p in base.items() if key not in copied)
+                merged = list(heapq.merge(merged, unchanged, key=lambda item: item[0]))
+            _write_snapshot(path, merged)
+            new_snapshot = _Snapshot(path)
+
+            with self._lock:
+                # Drop recent entries that did not change while the file was written.
+                for key, p in copied.items():
+                    current = self._recent.get(key)
+                    if current is not None and current.hits == p.hits:
+                        del self._recent[key]
+                self._snapshot = new_snapshot
+                self.path = path
+            # Every reader holds self._lock, so nothing still uses the old mapping.
+            if base is not None:
+                base.close()
+            return len(merged)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "recent_indicators": len(self._recent),
+                "snapshot_indicators": self._snapshot.count if self._snapshot else 0,
+                "snapshot_path": self.path,
+                "evictions": self.evictions,
+            }
+
+
+def main(argv=None):
+    """Query a snapshot file: python -m app.intel_index SNAPSHOT VALUE [FIELD]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print("usage: python -m app.intel_index SNAPSHOT VALUE [FIELD]")
+        return 2
+    index = IntelIndex(argv[0])
+    print(json.dumps(index.lookup(argv[1], argv[2] if len(argv) > 2 else None), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
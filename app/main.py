@@ -1,21 +1,243 @@
 
-from fastapi import FastAPI, HTTPException, Header, BackgroundTasks
-from pydantic import BaseModel
-from typing import List, Optional, Dict
-import requests
+import asyncio
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Header
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import List, Optional, Dict, Tuple
 import logging
+import os
 
-# Import detector
-from app.detector import detect_scam_signals
+# Import detector (behind the result cache)
+from app.admission import AdmissionControl, TokenBuckets
+from app.agent import generate_agent_reply
+from app.auth import verify_api_key
+from app.responses import AnalysisResponse, encode_analysis, encode_not_sure
+from app.schemas import ScamResponse
+from app.streaming import NDJSONStream
+from app.cache import DetectionCache, raw_key
+from app.detector import detect_in_worker, normalize_message
+from app import rules, worker_slot
+from app.session import INTEL_FIELDS, SessionStore
+from app.shared_state import SharedIntelIndex, SharedSessionStore
+from app.intel_index import IntelIndex
+from app.campaign import MAX_SIGNATURE_CHARS, Campaign, CampaignIndex
+from app.callback import CallbackCoalescer, CallbackDispatcher
+from app.metrics import (
+    CATEGORY_HITS, REGISTRY, REJECTED, REQUEST_SECONDS, STAGE_SECONDS, SWALLOWED_ERRORS, VERDICTS, now,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
 # --- CONFIGURATION ---
 API_KEY = "test-secret-key"
-GUVI_CALLBACK_URL = "https://hackathon.guvi.in/api/updateHoneyPotFinalResult"
+MAX_BATCH_SIZE = 500
+GUVI_CALLBACK_URL = os.environ.get("GUVI_CALLBACK_URL", "https://hackathon.guvi.in/api/updateHoneyPotFinalResult")
+CALLBACK_OUTBOX_DIR = os.environ.get("CALLBACK_OUTBOX_DIR", "callback_outbox")
+# seconds of silence before a session's report goes out...
+CALLBACK_QUIET_PERIOD = float(os.environ.get("CALLBACK_QUIET_PERIOD", "10"))
+# ...or after this many scam messages, whichever is first
+CALLBACK_MAX_MESSAGES = int(os.environ.get("CALLBACK_MAX_MESSAGES", "10"))
+# SQLite file shared by all uvicorn workers on this host; empty = per-process sessions
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "")
+INTEL_INDEX_PATH = os.environ.get("INTEL_INDEX_PATH", "intel_index.snap")
+INTEL_SNAPSHOT_INTERVAL = float(os.environ.get("INTEL_SNAPSHOT_INTERVAL", "300"))
+# Messages longer than this are scored in the process pool, off the event loop
+LARGE_MESSAGE_CHARS = int(os.environ.get("LARGE_MESSAGE_CHARS", "4096"))
+# ...and get this long before the "not sure" reply goes out instead
+DETECT_DEADLINE_SECONDS = float(os.environ.get("DETECT_DEADLINE_SECONDS", "2"))
+DETECT_POOL_WORKERS = int(os.environ.get("DETECT_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+# --- ADMISSION CONTROL ---
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", "256"))  # beyond: 503
+MAX_CONCURRENT_STREAMS = int(os.environ.get("MAX_CONCURRENT_STREAMS", "32"))  # open /analyze-scam/stream; beyond: 503
+MAX_BODY_BYTES = int(os.environ.get("MAX_BODY_BYTES", str(2 * 1024 * 1024)))    # beyond: 413
+MAX_HISTORY_MESSAGES = int(os.environ.get("MAX_HISTORY_MESSAGES", "200"))         # beyond: 422
+MAX_SESSION_ID_CHARS = int(os.environ.get("MAX_SESSION_ID_CHARS", "256"))         # beyond: 422
+# token buckets: sustained requests/second and burst size (beyond: 429)
+API_KEY_RATE = float(os.environ.get("API_KEY_RATE", "500"))
+API_KEY_BURST = float(os.environ.get("API_KEY_BURST", "1000"))
+SESSION_RATE = float(os.environ.get("SESSION_RATE", "2"))
+SESSION_BURST = float(os.environ.get("SESSION_BURST", "20"))
+SESSION_LIMIT_SLOTS = int(os.environ.get("SESSION_LIMIT_SLOTS", str(1 << 20)))  # 16 bytes each
+# seconds between checks of the rules file (app/rules.json or $RULES_PATH)
+RULES_RELOAD_INTERVAL = float(os.environ.get("RULES_RELOAD_INTERVAL", "2"))
+
+# Detection results for repeated message templates
+detection_cache = DetectionCache()
+
+# Fixed-size rate limit tables (see app.admission)
+api_key_buckets = TokenBuckets(API_KEY_RATE, API_KEY_BURST, slots=1024)
+session_buckets = TokenBuckets(SESSION_RATE, SESSION_BURST, slots=SESSION_LIMIT_SLOTS)
+
+# Workers for large messages; started (and warmed) by the lifespan. 0 disables offloading.
+detect_pool: Optional[ProcessPoolExecutor] = None
+
+# Hot reload of the score/reply rules; cached verdicts from old rules are dropped
+rules_reloader = rules.RulesReloader(RULES_RELOAD_INTERVAL, on_reload=lambda engine: detection_cache.clear())
+
+# Near-duplicate campaign clustering
+campaign_index = CampaignIndex()
+
+# Per-session aggregates (running hits, cumulative risk, merged intel)
+session_store = SharedSessionStore(SESSION_DB_PATH) if SESSION_DB_PATH else SessionStore()
+
+# Indicator -> sessions that reported it. With a shared store every worker
+# reads and writes the same table; otherwise each worker process keeps its
+# own index, reloaded from its own snapshot file (see app.worker_slot).
+intel_index_slot = worker_slot.claim(INTEL_INDEX_PATH) if INTEL_INDEX_PATH and not SESSION_DB_PATH else None
+if SESSION_DB_PATH:
+    intel_index = SharedIntelIndex(SESSION_DB_PATH)
+else:
+    intel_index = IntelIndex(intel_index_slot.path if intel_index_slot else None)
+
+# Pooled, queued delivery of GUVI callbacks
+callback_dispatcher = CallbackDispatcher(GUVI_CALLBACK_URL, outbox_dir=CALLBACK_OUTBOX_DIR)
+# One cumulative report per session instead of one POST per scam message
+# (with a shared store, workers also agree on which of them sends each report)
+callback_coalescer = CallbackCoalescer(callback_dispatcher, CALLBACK_QUIET_PERIOD, CALLBACK_MAX_MESSAGES,
+                                       claim=session_store.claim_report if SESSION_DB_PATH else None)
+
+def _adopt_intel_snapshots():
+    """Merges the snapshots of worker slots nobody holds into this worker's
+    index, so their indicators stay searchable after --workers shrinks."""
+    adopted_paths = []
+    for slot in worker_slot.existing_slots(INTEL_INDEX_PATH):
+        if slot == intel_index_slot.slot:
+            continue
+        orphan_slot = worker_slot.try_claim(INTEL_INDEX_PATH, slot)
+        if orphan_slot is None:
+            continue  # a live worker's
+        try:
+            adopted = intel_index.adopt(orphan_slot.path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Intel index snapshot {orphan_slot.path} not adopted: {e}")
+            orphan_slot.release()
+            continue
+        logger.info(f"Adopted {adopted} indicators from intel index snapshot {orphan_slot.path}")
+        adopted_paths.append(orphan_slot)
+    if adopted_paths:
+        # Written into our own snapshot before the orphans are removed
+        intel_index.snapshot()
+        for orphan_slot in adopted_paths:
+            os.remove(orphan_slot.path)
+            orphan_slot.release()
+
+async def _snapshot_intel_index(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(intel_index.snapshot)
+        except Exception as e:
+            SWALLOWED_ERRORS.inc("intel_snapshot")
+            logger.error(f"Intel index snapshot failed: {e}")
+
+async def _start_detect_pool():
+    global detect_pool
+    if DETECT_POOL_WORKERS <= 0:
+        return
+    # forkserver: workers are not forked from this process and its running threads
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" in methods:
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["app.detector"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    detect_pool = ProcessPoolExecutor(DETECT_POOL_WORKERS, mp_context=context)
+    # Pre-warm: one task per worker, so imports and regex compiles happen now,
+    # not on the first large message.
+    engine = rules.current()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(
+        loop.run_in_executor(detect_pool, detect_in_worker, "warm up", rules.RULES_PATH, engine.version)
+        for _ in range(DETECT_POOL_WORKERS)
+    ))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await _start_detect_pool()
+    await callback_dispatcher.start()
+    await callback_coalescer.start()
+    rules_reloader.start()
+    snapshotter = None
+    if intel_index_slot is not None:
+        try:
+            await asyncio.to_thread(_adopt_intel_snapshots)
+        except Exception as e:
+            SWALLOWED_ERRORS.inc("intel_snapshot")
+            logger.error(f"Intel index snapshot adoption failed: {e}")
+        snapshotter = asyncio.create_task(_snapshot_intel_index(INTEL_SNAPSHOT_INTERVAL))
+    yield
+    if snapshotter is not None:
+        snapshotter.cancel()
+    rules_reloader.stop()
+    if intel_index_slot is not None:
+        try:
+            intel_index.snapshot()
+        except Exception as e:
+            logger.error(f"Intel index snapshot failed: {e}")
+    await callback_coalescer.stop()
+    await callback_dispatcher.stop()
+    if detect_pool is not None:
+        # Waiting lets the workers exit and their queues and semaphores be
+        # released; in a thread, so a message still being scored does not
+        # block the loop.
+        await asyncio.to_thread(detect_pool.shutdown, wait=True, cancel_futures=True)
+
+app = FastAPI(lifespan=lifespan)
+
+# --- METRICS ---
+class RequestTimer:
+    """ASGI middleware: end-to-end time per route, including JSON decode/encode."""
+
+    def __init__(self, app):
+        self.app = app
+        self.paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if self.paths is None:
+            self.paths = {route.path for route in app.routes}
+        path = scope["path"] if scope["path"] in self.paths else "other"
+        started = now()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            REQUEST_SECONDS.observe(now() - started, path)
+
+# Added first so it sits inside RequestTimer: shed requests are still timed.
+app.add_middleware(AdmissionControl, paths=("/analyze-scam", "/analyze-scam/batch"),
+                   max_concurrent=MAX_CONCURRENT_REQUESTS, max_body_bytes=MAX_BODY_BYTES,
+                   key_buckets=api_key_buckets, api_keys=(API_KEY.encode("latin-1"),))
+app.add_middleware(RequestTimer)
+
+def _collect_component_stats():
+    dispatch = callback_dispatcher.stats()
+    yield ("scam_callback_queue_depth", "gauge", "Callbacks waiting in the dispatcher queue",
+           {"": dispatch["queue_depth"]})
+    yield ("scam_callbacks_total", "counter", "Callback delivery outcomes",
+           {f'{{outcome="{k}"}}': dispatch[k] for k in ("sent", "failed", "retried", "dropped", "replayed")})
+    if "outbox" in dispatch:
+        yield ("scam_callback_outbox_pending", "gauge", "Unacked callbacks in the outbox",
+               {"": dispatch["outbox"]["pending"]})
+    coalesce = callback_coalescer.stats()
+    yield ("scam_callback_coalescer_pending_sessions", "gauge", "Sessions with an unsent report",
+           {"": coalesce["pending_sessions"]})
+    cache = detection_cache.stats()
+    yield ("scam_detection_cache_total", "counter", "Detection cache lookups and evictions",
+           {f'{{result="{k}"}}': cache[k] for k in ("hits", "misses", "evictions")})
+    yield ("scam_detection_cache_entries", "gauge", "Entries in the detection cache", {"": cache["entries"]})
+    yield ("scam_campaigns", "gauge", "Campaigns held in the near-duplicate index", {"": len(campaign_index)})
+    yield ("scam_intel_indicators", "gauge", "Indicators in the intel index",
+           {"": len(intel_index)})
+    yield ("scam_sessions", "gauge", "Sessions held in the session store", {"": len(session_store)})
+    yield ("scam_streams_open", "gauge", "Open /analyze-scam/stream connections", {"": NDJSONStream.open_streams})
+
+REGISTRY.register_collector(_collect_component_stats)
 
 class Message(BaseModel):
     text: str
@@ -23,117 +245,377 @@ class Message(BaseModel):
     timestamp: int
 
 class AnalysisRequest(BaseModel):
-    sessionId: str
+    sessionId: str = Field(max_length=MAX_SESSION_ID_CHARS)
     message: Message
-    conversationHistory: List[Dict] = []
+    conversationHistory: List[Dict] = Field(default=[], max_length=MAX_HISTORY_MESSAGES)
     metadata: Dict = {}
 
-# --- SMART REPLY LOGIC (UNCHANGED) ---
+    @model_validator(mode="wrap")
+    @classmethod
+    def _timed_parse(cls, data, handler):
+        started = now()
+        try:
+            return handler(data)
+        finally:
+            STAGE_SECONDS.observe(now() - started, "parse")
+
+# --- SMART REPLY LOGIC ---
 def generate_smart_reply(keywords: List[str]) -> str:
-    # ... (Keep your existing bait logic from V3.0 here) ...
-    # For brevity, I am pasting the function body you already have
+    # Bait replies are the "replies" table of the rules file
+    engine = rules.current()
     try:
-        if any(k in keywords for k in ["arrest", "cbi", "police", "drugs", "customs", "seized", "narcotics"]):
-            return "Sir, please don't arrest me! I am a law-abiding citizen. I am very scared. What is the procedure to clear this? I can pay whatever fine."
-        if any(k in keywords for k in ["video", "viral", "leak", "youtube", "private", "footage", "upload"]):
-            return "Please, I beg you, do not share that video! My family will kill me. Tell me what to do, I will pay you right now."
-        if any(k in keywords for k in ["lottery", "won", "prize", "congratulations", "lakh", "crore"]):
-            return "Omg is this real?? I really need this money right now. I don't have a bank account, can I use my friend's UPI? What details do you need?"
-        if any(k in keywords for k in ["hiring", "job", "wfh", "salary", "earn", "telegram", "daily"]):
-            return "I am interested! I lost my job recently and really need this income. Do I have to pay any registration fee? I can start immediately."
-        if any(k in keywords for k in ["electricity", "bill", "disconnect", "power", "cut off"]):
-            return "Wait, I thought I paid it? Please don't cut the power, my mom is on oxygen support. How do I update it immediately?"
-        if any(k in keywords for k in ["mom", "dad", "hospital", "emergency", "accident"]):
-            return "Oh my god, are you okay? I am panicking. I can't call right now, just text me the UPI ID. How much do you need?"
-        if any(k in keywords for k in ["invest", "profit", "crypto", "double", "returns"]):
-            return "That sounds like a great return. Is it safe? I have 10,000 rs to invest right now. How do I join the group?"
-        return "I am not sure I understand. Can you explain clearly what I need to do? I am ready to cooperate."
+        return engine.reply(keywords)
     except Exception:
-        return "I received this message but I'm not sure what it means. Who is this?"
+        return engine.fallback_reply
 
 # --- MANDATORY CALLBACK FUNCTION ---
-def send_guvi_callback(session_id: str, is_scam: bool, msg_count: int, intelligence: Dict):
-    """Sends the mandatory final report to GUVI."""
+def send_guvi_callback(session_id: str, is_scam: bool, msg_count: int, intelligence: Dict,
+                       campaign_id: Optional[str] = None):
+    """Queues the mandatory final report to GUVI (coalesced per session)."""
+    callback_coalescer.offer(session_id, msg_count, intelligence, campaign_id)
+
+def _assign_campaign(text: str) -> Optional[Campaign]:
+    """The campaign (near-duplicate template) of the normalized `text`."""
+    started = now()
     try:
-        payload = {
-            "sessionId": session_id,
-            "scamDetected": is_scam,
-            "totalMessagesExchanged": msg_count,
-            "extractedIntelligence": {
-                "bankAccounts": intelligence.get("bankAccounts", []),
-                "upiIds": intelligence.get("upiIds", []),
-                "phishingLinks": intelligence.get("phishingLinks", []),
-                "phoneNumbers": intelligence.get("phoneNumbers", []),
-                "suspiciousKeywords": intelligence.get("suspiciousKeywords", [])
-            },
-            "agentNotes": "Scam intent detected via heuristic engine. Autonomous agent engaged to extract intelligence."
-        }
-        
-        # We use a timeout so it doesn't hang your server
-        response = requests.post(GUVI_CALLBACK_URL, json=payload, timeout=5)
-        logger.info(f"GUVI Callback Sent: {response.status_code} | {response.text}")
+        return campaign_index.assign(text)
+    except Exception as e:
+        SWALLOWED_ERRORS.inc("campaign")
+        logger.error(f"CRITICAL ERROR: {e}")
+        return None
+    finally:
+        STAGE_SECONDS.observe(now() - started, "campaign")
+
+def _detect(text: str) -> Tuple[Optional[Dict], Optional[Campaign]]:
+    """The detection result and the message's campaign. A campaign member
+    that misses the cache reuses the keyword hits of the campaign's
+    representative; extraction and scoring still run on the message."""
+    started = now()
+    campaign = None
+    try:
+        version = rules.current().version
+        normalized = normalize_message(text)
+        campaign = _assign_campaign(normalized.text)
+        keywords = campaign.representative_keywords(version) if campaign else None
+        result = detection_cache.detect_normalized(normalized, keywords)
+        if campaign is not None:
+            campaign.set_representative(version, result)
+        return result, campaign
+    except Exception as e:
+        SWALLOWED_ERRORS.inc("detect")
+        logger.error(f"CRITICAL ERROR: {e}")
+        return None, campaign
+    finally:
+        STAGE_SECONDS.observe(now() - started, "detect")
+
+def _detect_batch(texts: List[str]) -> List[Tuple[Optional[Dict], Optional[Campaign]]]:
+    """_detect for many messages. Members of a campaign with a representative
+    are scored one by one with its keywords; the rest go through one cache
+    pass, and their misses are scored together (see
+    DetectionCache.detect_normalized_batch)."""
+    started = now()
+    campaigns: List[Optional[Campaign]] = [None] * len(texts)
+    try:
+        version = rules.current().version
+        normalized = [normalize_message(text) for text in texts]
+        results: List[Optional[Dict]] = [None] * len(texts)
+        scan = []
+        for i, n in enumerate(normalized):
+            campaigns[i] = _assign_campaign(n.text)
+            keywords = campaigns[i].representative_keywords(version) if campaigns[i] else None
+            if keywords is None:
+                scan.append(i)
+            else:
+                results[i] = detection_cache.detect_normalized(n, keywords)
+        for i, result in zip(scan, detection_cache.detect_normalized_batch([normalized[i] for i in scan])):
+            results[i] = result
+            if campaigns[i] is not None:
+                campaigns[i].set_representative(version, result)
+        return list(zip(results, campaigns))
     except Exception as e:
-        logger.error(f"Failed to send GUVI callback: {e}")
+        SWALLOWED_ERRORS.inc("detect")
+        logger.error(f"CRITICAL ERROR: {e}")
+        return [(None, campaign) for campaign in campaigns]
+    finally:
+        STAGE_SECONDS.observe(now() - started, "detect_batch")
+
+async def _detect_async(text: str) -> Tuple[Optional[Dict], Optional[Campaign]]:
+    """Short messages are scored inline on the event loop. Large ones go to the
+    process pool so their regex work cannot hold the GIL for other requests.
+    Raises asyncio.TimeoutError past DETECT_DEADLINE_SECONDS."""
+    if detect_pool is None or len(text) <= LARGE_MESSAGE_CHARS:
+        return _detect(text)
 
-@app.post("/analyze-scam")
-def analyze_scam(request: AnalysisRequest, background_tasks: BackgroundTasks, x_api_key: str = Header(None)):
+    started = now()
+    engine = rules.current()
+    # Campaign signatures only read the first MAX_SIGNATURE_CHARS; normalizing
+    # that much is cheap even here.
+    campaign = _assign_campaign(normalize_message(text[:MAX_SIGNATURE_CHARS]).text)
+    # Normalizing a large message costs as much as scoring it, so it happens
+    # in the worker. Here the message is only hashed as received; repeats of
+    # it are served from the cache without going to the pool.
+    received_key = raw_key(text)
+    generation = detection_cache.generation
+    result = detection_cache.get(received_key)
+    if result is not None:
+        STAGE_SECONDS.observe(now() - started, "detect")
+        return result, campaign
+    keywords = campaign.representative_keywords(engine.version) if campaign else None
+    future = asyncio.get_running_loop().run_in_executor(
+        detect_pool, detect_in_worker, text, rules.RULES_PATH, engine.version, keywords)
     try:
-        if x_api_key != API_KEY:
-            raise HTTPException(status_code=401, detail="Invalid API Key")
+        # The worker finishes the message even after a timeout; only the reply stops waiting.
+        key, result = await asyncio.wait_for(future, DETECT_DEADLINE_SECONDS)
+    except asyncio.TimeoutError:
+        raise
+    except Exception as e:
+        SWALLOWED_ERRORS.inc("detect")
+        logger.error(f"CRITICAL ERROR: {e}")
+        return None, campaign
+    finally:
+        STAGE_SECONDS.observe(now() - started, "detect_pool")
+    detection_cache.put(received_key, result, generation)
+    detection_cache.put(key, result, generation)  # the normalized key, shared with inline scoring
+    if campaign is not None:
+        campaign.set_representative(engine.version, result)
+    return result, campaign
+
+def _check_session_rate(session_ids: List[str], api_key: Optional[str] = None):
+    """429 if any of these sessions is over its rate. Runs before detection.
+
+    Each session is charged one token per message, and only once every
+    session passed, so a rejected batch costs its sessions nothing. More
+    messages for one session than its burst can never pass: 413.
+
+    With `api_key`, the key's bucket is checked and charged the same way,
+    one token per message after the first (AdmissionControl charged that
+    one), so a batch costs the key what its messages sent singly would."""
+    key_cost = len(session_ids) - 1 if api_key is not None else 0
+    if key_cost > API_KEY_BURST - 1:
+        raise HTTPException(status_code=413, detail=f"More than {API_KEY_BURST:g} messages for this API key")
+    if key_cost:
+        wait = api_key_buckets.wait(api_key.encode("latin-1"), key_cost)
+        if wait:
+            REJECTED.inc("api_key_rate")
+            raise HTTPException(status_code=429, detail="Rate limit exceeded for this API key",
+                                headers={"Retry-After": str(max(1, int(wait + 0.999)))})
+    counts: Dict[str, int] = {}
+    for session_id in session_ids:
+        counts[session_id] = counts.get(session_id, 0) + 1
+    wait = 0.0
+    for session_id, count in counts.items():
+        if count > SESSION_BURST:
+            raise HTTPException(status_code=413,
+                                detail=f"More than {SESSION_BURST:g} messages for session {session_id}")
+        wait = max(wait, session_buckets.wait(session_id, count))
+    if wait:
+        REJECTED.inc("session_rate")
+        raise HTTPException(status_code=429, detail="Rate limit exceeded for this session",
+                            headers={"Retry-After": str(max(1, int(wait + 0.999)))})
+    for session_id, count in counts.items():
+        session_buckets.acquire(session_id, count)
+    if key_cost:
+        api_key_buckets.acquire(api_key.encode("latin-1"), key_cost)
 
-        # 1. Detect
-        detection_result = detect_scam_signals(request.message.text)
+def _not_sure_response() -> bytes:
+    return encode_not_sure("I received this message but I'm not sure what it means. Who is this?")
+
+def _analyze_request(request: AnalysisRequest, detection_result: Dict, campaign: Optional[Campaign]) -> bytes:
+    """Builds the response body for one message and schedules its callback."""
+    try:
+        # 1. Detect (done by the caller)
         score = detection_result["confidence"]
         keywords = detection_result["suspicious_keywords"]
         extracted_data = detection_result["extracted_data"] # Regex results
         
         is_scam = score > 60
+        VERDICTS.inc("scam" if is_scam else "not_scam")
+        for category in detection_result.get("categories", ()):
+            CATEGORY_HITS.inc(category)
+
+        # Which campaign (near-duplicate template) this message belongs to (assigned by _detect)
+        campaign_id = campaign.campaign_id if campaign else None
+
+        # Fold this turn into the session aggregates (O(new message))
+        started = now()
+        session = session_store.update(request.sessionId, detection_result)
+        STAGE_SECONDS.observe(now() - started, "session")
+
+        # Cross-session index of the indicators in this message
+        if any(extracted_data.get(f) for f in INTEL_FIELDS):
+            started = now()
+            intel_index.record(request.sessionId, extracted_data)
+            STAGE_SECONDS.observe(now() - started, "intel_index")
         
-        # 2. Reply
+        # 2. Reply: bait for this message's keywords, else whatever the whole
+        # conversation calls for (its cumulative risk, the intel still missing)
+        started = now()
+        reply_text = generate_smart_reply(keywords) if is_scam else None
+        if reply_text is None or reply_text == rules.current().default_reply:
+            reply_text = generate_agent_reply(session.to_agent_session_data(), request.message.text)
+        STAGE_SECONDS.observe(now() - started, "reply")
+
+        # 3. FIRE CALLBACK (MANDATORY)
+        # We send this ONLY if it's a scam. The coalescer batches turns per session.
+        # The dispatcher queue lets us reply to the user immediately, then notify GUVI.
         if is_scam:
-            reply_text = generate_smart_reply(keywords)
-        else:
-            reply_text = "I received this message but I'm not sure what it means. Who is this?"
+            started = now()
+            total_msgs = max(len(request.conversationHistory) + 1, session.message_count)
+            # Cumulative session intel, so whichever report goes out is complete
+            send_guvi_callback(request.sessionId, True, total_msgs, session.intelligence(), campaign_id)
+            STAGE_SECONDS.observe(now() - started, "callback")
 
-        # 3. PREPARE INTELLIGENCE DATA
-        intelligence_payload = extracted_data
-        intelligence_payload["suspiciousKeywords"] = keywords
+        # 4. Return Response (pre-encoded JSON, see app.responses)
+        return encode_analysis(reply_text, is_scam, score, extracted_data, keywords, campaign_id)
 
-        # 4. FIRE CALLBACK (MANDATORY)
-        # We send this ONLY if it's a scam.
-        # We use BackgroundTasks so we reply to the user immediately, then notify GUVI.
-        if is_scam:
-            total_msgs = len(request.conversationHistory) + 1
-            background_tasks.add_task(
-                send_guvi_callback, 
-                request.sessionId, 
-                True, 
-                total_msgs, 
-                intelligence_payload
-            )
-
-        # 5. Return Response
-        return {
-            "status": "success",
-            "reply": reply_text,
-            "is_scam": is_scam,
-            "confidence_score": score,
-            "confidence_percentage": f"{score}%",
-            "extracted_intelligence": {
-                "upi_id": extracted_data.get("upiIds"),
-                "phone_number": extracted_data.get("phoneNumbers"),
-                "phishing_link": extracted_data.get("phishingLinks"),
-                "suspicious_keywords": keywords
-            },
-            "explanation": f"Risk score {score}% based on keywords: {keywords}"
-        }
-
-    except HTTPException as he:
-        raise he
     except Exception as e:
+        SWALLOWED_ERRORS.inc("analyze")
         logger.error(f"CRITICAL ERROR: {e}")
-        return {
-            "status": "success",
-            "reply": "I received this message but I'm not sure what it means. Who is this?",
-            "is_scam": False
-        }
+        return _not_sure_response()
+
+async def _analyze_one(request: AnalysisRequest) -> bytes:
+    """Detection (inline or in the pool, under the deadline), then the same
+    session, callback and response handling for every single-message path."""
+    started = now()
+    try:
+        detection_result, campaign = await _detect_async(request.message.text)
+    except asyncio.TimeoutError:
+        SWALLOWED_ERRORS.inc("detect_deadline")
+        logger.warning(f"Detection deadline ({DETECT_DEADLINE_SECONDS}s) passed for session {request.sessionId}")
+        response = _not_sure_response()
+    else:
+        if SESSION_DB_PATH:
+            # The shared store commits to SQLite and may wait on other workers'
+            # transactions (busy timeout); keep that off the event loop.
+            response = await asyncio.to_thread(_analyze_request, request, detection_result, campaign)
+        else:
+            response = _analyze_request(request, detection_result, campaign)
+    STAGE_SECONDS.observe(now() - started, "handler")
+    return response
+
+@app.post("/analyze-scam", response_model=ScamResponse, response_class=AnalysisResponse)
+async def analyze_scam(request: AnalysisRequest, x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+    _check_session_rate([request.sessionId])
+    return AnalysisResponse(await _analyze_one(request))
+
+def _analyze_batch(batch: List[AnalysisRequest], pooled: Dict[int, object]) -> bytes:
+    """Response body for a batch. `pooled` holds the outcome of each message
+    already sent to the process pool: a detection, or the deadline error."""
+    inline = [i for i in range(len(batch)) if i not in pooled]
+    detected = dict(zip(inline, _detect_batch([batch[i].message.text for i in inline])))
+    parts = []
+    for i, request in enumerate(batch):
+        outcome = pooled[i] if i in pooled else detected[i]
+        if isinstance(outcome, BaseException):
+            SWALLOWED_ERRORS.inc("detect_deadline")
+            logger.warning(f"Detection deadline ({DETECT_DEADLINE_SECONDS}s) passed for session {request.sessionId}")
+            parts.append(_not_sure_response())
+        else:
+            parts.append(_analyze_request(request, *outcome))
+    return b"[" + b",".join(parts) + b"]"
+
+@app.post("/analyze-scam/batch", response_model=List[ScamResponse], response_class=AnalysisResponse)
+async def analyze_scam_batch(batch: List[AnalysisRequest], x_api_key: str = Header(None)):
+    """One auth check and one parse for a burst of messages. Results come back in request order.
+
+    The batch is scored at once: one keyword scan over all its messages and
+    the score rules applied to the message x keyword hit matrix as bitmask
+    operations (see RuleEngine.score_batch). Messages over
+    LARGE_MESSAGE_CHARS go to the process pool under the detection
+    deadline, as on /analyze-scam. The API key's rate limit counts every
+    message in the batch."""
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+    if len(batch) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch larger than {MAX_BATCH_SIZE} messages")
+    _check_session_rate([r.sessionId for r in batch], api_key=x_api_key)
+
+    pooled: Dict[int, object] = {}
+    if detect_pool is not None:
+        large = [i for i, r in enumerate(batch) if len(r.message.text) > LARGE_MESSAGE_CHARS]
+        outcomes = await asyncio.gather(*(_detect_async(batch[i].message.text) for i in large),
+                                        return_exceptions=True)
+        pooled = dict(zip(large, outcomes))
+    # Sessions, campaigns and the shared store for up to MAX_BATCH_SIZE messages: off the loop.
+    return AnalysisResponse(await asyncio.to_thread(_analyze_batch, batch, pooled))
+
+def _stream_error(detail, session_id: Optional[str] = None, **extra) -> bytes:
+    return json.dumps({"sessionId": session_id, "error": detail, **extra}, separators=(",", ":")).encode()
+
+@app.post("/analyze-scam/stream", response_class=NDJSONStream)
+async def analyze_scam_stream(x_api_key: str = Depends(verify_api_key)):
+    """NDJSON feed: one AnalysisRequest per line in, one result per line out,
+    in input order, while the client is still sending. Authenticated once.
+
+    Each record is charged to the API key's token bucket; when it is empty
+    the stream slows down instead of failing. Bad records and records over
+    their session's rate get an {"error": ...} line and the stream goes on.
+    Not behind AdmissionControl: its body cap applies per line instead, and
+    its in-flight limit is on open streams, MAX_CONCURRENT_STREAMS (503
+    beyond), since one stream lasts as long as the feed.
+    """
+    if NDJSONStream.open_streams >= MAX_CONCURRENT_STREAMS:
+        REJECTED.inc("streams")
+        raise HTTPException(status_code=503, detail="Too many open streams, retry shortly",
+                            headers={"Retry-After": "1"})
+    key = x_api_key.encode("latin-1")  # the same bucket the middleware charges
+
+    async def handle(line: bytes) -> bytes:
+        wait = api_key_buckets.acquire(key)
+        while wait:
+            await asyncio.sleep(wait)
+            wait = api_key_buckets.acquire(key)
+        try:
+            request = AnalysisRequest.model_validate_json(line)
+        except ValidationError as e:
+            return _stream_error(e.errors(include_url=False, include_context=False, include_input=False))
+        wait = session_buckets.acquire(request.sessionId)
+        if wait:
+            REJECTED.inc("session_rate")
+            return _stream_error("Rate limit exceeded for this session", request.sessionId,
+                                 retry_after=max(1, int(wait + 0.999)))
+        return await _analyze_one(request)
+
+    return NDJSONStream(handle, max_line_bytes=MAX_BODY_BYTES)
+
+@app.get("/callback-stats")
+def callback_stats(x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+    stats = callback_dispatcher.stats()
+    stats["coalescer"] = callback_coalescer.stats()
+    return stats
+
+@app.get("/cache-stats")
+def cache_stats(x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+    return detection_cache.stats()
+
+@app.get("/intel/lookup")
+def intel_lookup(value: str, field: Optional[str] = None, x_api_key: str = Header(None)):
+    """Which sessions reported an indicator, e.g. ?value=manager@upi. Searches every field unless one is given."""
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+    if field is not None and field not in INTEL_FIELDS:
+        raise HTTPException(status_code=400, detail=f"field must be one of {', '.join(INTEL_FIELDS)}")
+    return {"value": value, "matches": intel_index.lookup(value, field)}
+
+@app.post("/rules/reload")
+def reload_rules(x_api_key: str = Header(None)):
+    """Recompiles the rules file now instead of waiting for the file watcher."""
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+    try:
+        engine = rules.reload()
+    except (OSError, rules.RulesError) as e:
+        raise HTTPException(status_code=422, detail=f"Rules not reloaded: {e}")
+    detection_cache.clear()
+    return {"version": engine.version, "loaded_at": engine.loaded_at, "path": rules.RULES_PATH}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
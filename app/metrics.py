@@ -0,0 +1,180 @@
+"""Low-overhead in-process metrics with a Prometheus text exporter.
+
+Hot-path calls are a perf_counter() read, a bisect over fixed buckets and
+a few list/dict updates. Each thread writes to its own shard, so recording
+takes no lock; shards are summed when /metrics is scraped. Nothing is
+allocated per observation once a label has been seen in a thread.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Seconds. Covers 50 us cached hits up to multi-second large-message scans.
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+now = time.perf_counter  # monotonic clock used for every span
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Sharded:
+    """Per-thread dicts of label values -> series, merged on read."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def _snapshot(self) -> List[Dict]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        # Copy each dict; a recording thread may add a label concurrently.
+        return [dict(shard) for shard in shards]
+
+
+class Counter(_Sharded):
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def inc(self, *labelvalues, amount: float = 1):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def _totals(self) -> Dict[Tuple, float]:
+        totals: Dict[Tuple, float] = {}
+        for shard in self._snapshot():
+            for labelvalues, value in shard.items():
+                totals[labelvalues] = totals.get(labelvalues, 0) + value
+        return totals
+
+    def value(self, *labelvalues) -> float:
+        return self._totals().get(labelvalues, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in sorted(self._totals().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram(_Sharded):
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labelvalues):
+        # series: [count per bucket..., +Inf count, sum]
+        try:
+            series = self._local.shard[labelvalues]
+        except (AttributeError, KeyError):
+            series = self._shard()[labelvalues] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _totals(self) -> Dict[Tuple, List[float]]:
+        totals: Dict[Tuple, List[float]] = {}
+        for shard in self._snapshot():
+            for labelvalues, series in shard.items():
+                total = totals.setdefault(labelvalues, [0] * len(series))
+                for i, v in enumerate(series):
+                    total[i] += v
+        return totals
+
+    def count(self, *labelvalues) -> int:
+        series = self._totals().get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        items = sorted(self._totals().items())
+        names = self.labelnames + ("le",)
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, labelvalues + (le,))} {cumulative}")
+            base = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{base} {series[-1]}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, float]]]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable):
+        """collector() yields (name, type, help, {label value or "": number}).
+        Used for values owned elsewhere (queue depth, cache counters), read at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for label, value in samples.items():
+                    lines.append(f"{name}{label} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- HOT-PATH METRICS ---
+STAGE_SECONDS = REGISTRY.histogram(
+    "scam_stage_seconds", "Time spent per request stage", ("stage",))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "scam_http_request_seconds", "End-to-end HTTP request time", ("path",))
+VERDICTS = REGISTRY.counter(
+    "scam_verdicts_total", "Messages scored, by verdict", ("verdict",))
+CATEGORY_HITS = REGISTRY.counter(
+    "scam_category_hits_total", "Messages that hit each keyword category", ("category",))
+SWALLOWED_ERRORS = REGISTRY.counter(
+    "scam_swallowed_exceptions_total", "Exceptions caught and turned into a fallback reply", ("stage",))
+REJECTED = REGISTRY.counter(
+    "scam_admission_rejected_total", "Requests shed by admission control", ("reason",))
@@ -0,0 +1,177 @@
+"""One-pass text normalization, run once per message before matching.
+
+A message is normalized into two views:
+
+    text   NFKC-folded, invisible characters removed, Latin lookalikes
+           (Cyrillic/Greek letters mixed into Latin words, or whole
+           lookalike words in a Latin-script message) mapped to
+           ASCII, whitespace runs collapsed. Case is kept. The extractors
+           and the detection cache key use this view.
+    match  `text` lowercased, leetspeak keywords folded ("p@y", "m0ney")
+           and punctuation runs collapsed. The keyword engine and the score
+           rules use this view.
+
+`flags` records which obfuscations were undone; score rules can test them
+with {"flag": [...]}. `match` depends only on `text` and the rule set, but
+`flags` does not (folded lookalikes leave no trace in `text`), so a cache
+must key on `text` and `flags` together, and be cleared on rules reload.
+Romanized Hindi terms ("paisa bhejo") are not rewritten here: the rule
+engine's keyword index resolves them in the same scan that finds the
+English keywords, which saves a second pass.
+"""
+import hashlib
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, NamedTuple
+
+LEETSPEAK = "leetspeak"
+CONFUSABLES = "confusables"
+FLAGS = frozenset({LEETSPEAK, CONFUSABLES})
+
+# --- TABLES ---
+# Zero-width and formatting characters used to split words ("p\u200bay").
+_INVISIBLE = dict.fromkeys(map(ord, "\u00ad\u180e\u200b\u200c\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff"))
+
+# Letters that render like ASCII in common fonts. Fullwidth and mathematical
+# letters are already handled by NFKC.
+_CONFUSABLES = str.maketrans({
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c",
+    "т": "t", "у": "y", "х": "x", "і": "i", "ј": "j", "ѕ": "s", "ԁ": "d", "ӏ": "l", "ԛ": "q", "ԝ": "w",
+    "А": "A", "В": "B", "Е": "E", "К": "K", "М": "M", "Н": "H", "О": "O", "Р": "P", "С": "C",
+    "Т": "T", "У": "Y", "Х": "X", "І": "I", "Ј": "J", "Ѕ": "S", "Ԁ": "D", "Ӏ": "I",
+    # Greek
+    "α": "a", "ε": "e", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x",
+    "Α": "A", "Β": "B", "Ε": "E", "Ζ": "Z", "Η": "H", "Ι": "I", "Κ": "K", "Μ": "M", "Ν": "N",
+    "Ο": "O", "Ρ": "P", "Τ": "T", "Υ": "Y", "Χ": "X",
+    # Latin
+    "ı": "i", "ɡ": "g", "ɑ": "a",
+})
+_CONFUSABLE_CHARS = "".join(chr(c) for c in _CONFUSABLES)
+# A word holding at least one lookalike. The lookbehind pins each attempt to
+# a word start, so the lazy lookahead keeps the scan linear.
+_CONFUSABLE_WORD = re.compile(r'(?<!\w)(?=\w*?[%s])\w+' % _CONFUSABLE_CHARS)
+_ASCII_LETTER = re.compile(r'[a-zA-Z]')
+_GREEK_CYRILLIC = re.compile(r'[\u0370-\u03ff\u0400-\u052f]')
+
+_LEET = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"})
+_LEET_CHARS = "013457@$"
+_LEET_WORD_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789@$")
+# A leet character touching a letter, through to the end of its word.
+# Starting with the character class lets re skip ahead with its fast prefix
+# search; the start of the word is then found by hand.
+_LEET_HINT = re.compile(r'[013457@$](?:(?<=[a-z].)|(?=[a-z]))[a-z0-9@$]*')
+_DIGIT_RUN = re.compile(r'\d\d')  # "24hrs", "500rs", "covid19": numbers, not leetspeak
+# Repeats of one ASCII punctuation character (NFKC already turned "…" into
+# "..."). A positive class lets re scan for the first character at C speed.
+_PUNCT_RUN = re.compile(r'([!-/:-@\[-`{-~])\1+')  # "!!!!" -> "!", "...." -> "."
+_WHITESPACE = "\t\n\r\f\v"
+
+
+class NormalizedText(NamedTuple):
+    text: str
+    match: str
+    flags: FrozenSet[str]
+
+    def key(self) -> bytes:
+        """Content address for caches: `flags` and `text`. Spacing and width
+        variants of one template share a key, lookalike or leetspeak variants
+        do not. Flags never contain "\0", so the key is unambiguous."""
+        data = ",".join(sorted(self.flags)) + "\0" + self.text
+        return hashlib.blake2b(data.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class Normalizer:
+    """Builds NormalizedText for one rule set.
+
+    `vocabulary` holds the keyword words. A word is leet-folded only when
+    the substituted characters land inside one of them ("p@yment" starts
+    with "pay"), so "raju@ybl" or "0tp" are left alone. Folding alone does
+    not set the leetspeak flag: chat spells "h0me" and "n0w" too. The flag
+    is set only when a folded word starts with one of `leet_flag_words`
+    ("p@y", "m0ney", "j0b"), the spellings scams use to dodge filters.
+    """
+
+    def __init__(self, vocabulary: Iterable[str] = (), leet_flag_words: Iterable[str] = ()):
+        self.leet_flag_words = tuple(leet_flag_words)
+        self.vocabulary = frozenset(vocabulary) | frozenset(self.leet_flag_words)
+        self._prefixes = frozenset(w[:i] for w in self.vocabulary for i in range(len(w)))
+
+    def __call__(self, message: str) -> NormalizedText:
+        flags = set()
+        if not message.isascii():
+            message = unicodedata.normalize("NFKC", message).translate(_INVISIBLE)
+            message = _fold_confusable_words(message, flags)
+            text = " ".join(message.split())
+        else:
+            text = message.strip()
+            if "  " in text or any(c in text for c in _WHITESPACE):
+                text = " ".join(text.split())
+
+        match = text.lower()
+        if any(c in match for c in _LEET_CHARS):
+            match = self._fold_leet_words(match, flags)
+        match = _PUNCT_RUN.sub(r'\1', match)
+        return NormalizedText(text, match, frozenset(flags))
+
+    def _fold_leet_words(self, match: str, flags: set) -> str:
+        pieces = []
+        copied = 0
+        seen: Dict[str, str] = {}  # campaigns repeat the same words
+        for hint in _LEET_HINT.finditer(match):
+            start, end = hint.span()
+            while start > copied and match[start - 1] in _LEET_WORD_CHARS:
+                start -= 1
+            # Cheap reject: what comes before the hit must begin some keyword
+            # word ("p" of "p@y"; not "x" of "x@x@x@").
+            if match[start:hint.start()].translate(_LEET) not in self._prefixes:
+                continue
+            word = match[start:end]
+            folded = seen.get(word)
+            if folded is None:
+                folded = seen[word] = self._fold_leet(word, flags)
+            if folded != word:
+                pieces.append(match[copied:start])
+                pieces.append(folded)
+                copied = end
+        if not pieces:
+            return match
+        pieces.append(match[copied:])
+        return "".join(pieces)
+
+    def _fold_leet(self, word: str, flags: set) -> str:
+        # Fold only when the leet characters fall inside a keyword word, so
+        # "manager@upi" and "rs500" keep their own boundaries and digits.
+        if _DIGIT_RUN.search(word):
+            return word
+        folded = word.translate(_LEET)
+        first = min(word.find(c) for c in _LEET_CHARS if c in word)
+        if not any(folded[:end] in self.vocabulary for end in range(first + 1, len(folded) + 1)):
+            return word
+        if folded.startswith(self.leet_flag_words):
+            flags.add(LEETSPEAK)
+        return folded
+
+
+def _fold_confusable_words(message: str, flags: set) -> str:
+    latin = None  # whether the message is Latin script, decided on first need
+
+    def fold(m) -> str:
+        nonlocal latin
+        word = m.group(0)
+        folded = word.translate(_CONFUSABLES)
+        if not folded.isascii():
+            return word
+        if not _ASCII_LETTER.search(word):
+            # Made only of lookalikes ("ΚΥС", "как"): fold it when the rest
+            # of the message is Latin script, i.e. it has Latin letters and
+            # no Greek or Cyrillic letter that is not a lookalike.
+            if latin is None:
+                latin = bool(_ASCII_LETTER.search(message)) \
+                    and not _GREEK_CYRILLIC.search(message.translate(_CONFUSABLES))
+            if not latin:
+                return word
+        flags.add(CONFUSABLES)
+        return folded
+
+    return _CONFUSABLE_WORD.sub(fold, message)
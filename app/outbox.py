@@ -0,0 +1,384 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "seg-"
+SEGMENT_SUFFIX = ".log"
+ACK_INDEX = "acks.idx"
+
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_FLUSH_INTERVAL = 0.05  # seconds between group commits
+DEFAULT_FLUSH_BATCH = 256      # records that trigger an early commit
+DEFAULT_COMPACT_INTERVAL = 60.0  # min seconds between ack index rewrites
+
+
+def _segment_name(first_id: int) -> str:
+    return f"{SEGMENT_PREFIX}{first_id:012d}{SEGMENT_SUFFIX}"
+
+
+def _first_id(name: str) -> int:
+    return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _fsync_all(fds):
+    try:
+        for fd in fds:
+            os.fsync(fd)
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+class CallbackOutbox:
+    """Append-only, group-committed store of callbacks that are not yet delivered.
+
+    Layout of `directory`:
+      seg-<first id>.log  JSON lines {"id": n, "ts": t, "payload": {...}}
+      acks.idx            ids already delivered, one per line
+
+    append() and ack() only write to buffered files. A flusher thread
+    fsyncs both files every `flush_interval` seconds, or sooner once
+    `flush_batch` records are waiting. There is no per-record fsync, so a
+    crash can lose at most the last commit window. The flusher only holds
+    the lock to hand the buffers to the OS; the fsyncs run after it is
+    released, so append() never waits for the disk.
+
+    Segment ids are consecutive: a segment holds the ids from its first id
+    up to the next segment's. A closed segment whose last record is acked
+    (or that is rotated out fully acked) is deleted by the flusher. The
+    flusher also rewrites the ack index, at most every `compact_interval`
+    seconds and only after segments went away, to hold just the acks of
+    the segments that are left. compact() does both at once.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, flush_batch: int = DEFAULT_FLUSH_BATCH,
+                 compact_interval: float = DEFAULT_COMPACT_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.compact_interval = compact_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._flush_needed = threading.Condition(self._lock)
+        # segment name -> number of unacked records in it
+        self._segments: "OrderedDict[str, int]" = OrderedDict()
+        # unacked id -> (segment name, enqueue timestamp)
+        self._unacked: Dict[int, Tuple[str, float]] = {}
+        # closed segment -> one past its last id
+        self._segment_ends: Dict[str, int] = {}
+        self._drained: List[str] = []  # fully acked, file not deleted yet
+        self._stale_segments = 0       # deleted since the ack index was last rewritten
+        self._acks_since: Optional[List[int]] = None  # acks during an ack index rewrite
+        self._compact_lock = threading.Lock()  # one compaction at a time
+        self._last_rewrite = time.monotonic()
+        self._next_id = 1
+        self._unflushed = 0
+        self._closed = False
+
+        self._load()
+        self._segment_file = None
+        self._segment_name = None
+        self._open_segment()
+        for name, unacked in list(self._segments.items()):
+            if unacked == 0 and name != self._segment_name:
+                self._retire(name)
+        self._ack_file = open(os.path.join(directory, ACK_INDEX), "a", encoding="utf-8")
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="outbox-flusher", daemon=True)
+        self._flusher.start()
+
+    # --- recovery ---
+    def _segment_names(self):
+        return sorted(n for n in os.listdir(self.directory)
+                      if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX))
+
+    def _read_segment(self, name: str) -> Iterator[Dict]:
+        with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Torn write from a crash mid-commit; the rest of the file is unusable.
+                    logger.error(f"Outbox: skipping corrupt record in {name}")
+                    break
+
+    def _load(self):
+        acked = set()
+        ack_path = os.path.join(self.directory, ACK_INDEX)
+        if os.path.exists(ack_path):
+            with open(ack_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.isdigit():
+                        acked.add(int(line))
+
+        for name in self._segment_names():
+            unacked = 0
+            end = _first_id(name)
+            for record in self._read_segment(name):
+                record_id = record["id"]
+                end = max(end, record_id + 1)
+                if record_id not in acked:
+                    self._unacked[record_id] = (name, record.get("ts", 0.0))
+                    unacked += 1
+            self._next_id = max(self._next_id, end)
+            self._segments[name] = unacked
+            self._segment_ends[name] = end
+
+    def _open_segment(self):
+        if self._segment_file is not None:
+            self._segment_file.flush()
+            os.fsync(self._segment_file.fileno())
+            self._segment_file.close()
+            self._segment_ends[self._segment_name] = self._next_id
+            if self._segments[self._segment_name] == 0:
+                self._retire(self._segment_name)
+        self._segment_name = _segment_name(self._next_id)
+        self._segments.setdefault(self._segment_name, 0)
+        self._segment_file = open(os.path.join(self.directory, self._segment_name), "a", encoding="utf-8")
+        _fsync_dir(self.directory)
+
+    # --- hot path ---
+    def append(self, payload: Dict) -> int:
+        """Records a callback before it is dispatched. Returns its id."""
+        with self._lock:
+            record_id = self._next_id
+            self._next_id += 1
+            ts = time.time()
+            self._segment_file.write(json.dumps({"id": record_id, "ts": ts, "payload": payload},
+                                                separators=(",", ":")) + "\n")
+            self._unacked[record_id] = (self._segment_name, ts)
+            self._segments[self._segment_name] += 1
+            self._mark_dirty()
+            if self._segment_file.tell() >= self.segment_bytes:
+                self._open_segment()
+            return record_id
+
+    def ack(self, record_id: int):
+        """Marks a callback as delivered."""
+        with self._lock:
+            entry = self._unacked.pop(record_id, None)
+            if entry is None:
+                return
+            name = entry[0]
+            self._segments[name] -= 1
+            if self._segments[name] == 0 and name != self._segment_name:
+                self._retire(name)
+            self._ack_file.write(f"{record_id}\n")
+            if self._acks_since is not None:
+                self._acks_since.append(record_id)
+            self._mark_dirty()
+
+    def _retire(self, name: str):
+        # The flusher deletes the file; until then the ack index keeps its acks.
+        del self._segments[name]
+        self._drained.append(name)
+
+    def _mark_dirty(self):
+        self._unflushed += 1
+        if self._unflushed >= self.flush_batch:
+            self._flush_needed.notify()
+
+    # --- group commit ---
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                self._flush_needed.wait(self.flush_interval)
+                fds = self._write_out() if self._unflushed else None
+            # fsync without the lock: append() runs on the event loop and
+            # must not wait for the disk.
+            if fds:
+                try:
+                    _fsync_all(fds)
+                except OSError as e:
+                    logger.error(f"Outbox: group commit failed: {e}")
+            try:
+                self._delete_drained()
+                if self._stale_segments and time.monotonic() - self._last_rewrite >= self.compact_interval:
+                    self._rewrite_acks()
+            except OSError as e:
+                logger.error(f"Outbox: compaction failed: {e}")
+
+    def _write_out(self):
+        """Hands buffered records to the OS. Returns duplicated descriptors
+        to fsync; they stay valid if the files are rotated or closed meanwhile."""
+        self._segment_file.flush()
+        self._ack_file.flush()
+        self._unflushed = 0
+        return [os.dup(self._segment_file.fileno()), os.dup(self._ack_file.fileno())]
+
+    def _commit(self):
+        _fsync_all(self._write_out())
+
+    def sync(self):
+        """Forces a group commit now."""
+        with self._lock:
+            if self._unflushed:
+                self._commit()
+
+    # --- compaction ---
+    def compact(self):
+        """Drops fully-acked segments and rewrites the ack index now."""
+        self._delete_drained()
+        self._rewrite_acks()
+
+    def _delete_drained(self):
+        with self._compact_lock:
+            with self._lock:
+                drained = list(self._drained)
+            if not drained:
+                return
+            for name in drained:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+            _fsync_dir(self.directory)
+            with self._lock:
+                for name in drained:
+                    self._drained.remove(name)
+                    self._segment_ends.pop(name, None)
+                self._stale_segments += len(drained)
+
+    def _rewrite_acks(self):
+        """Rewrites the ack index to hold only acks of segments still on disk.
+
+        The lock is held only to snapshot the unacked ids and to swap the
+        files; the write and its fsync run without it. Acks that arrive in
+        between go to both files and are added to the new one before the
+        swap. A crash before the next group commit can lose only those,
+        which replays their callbacks, as losing a commit window would."""
+        with self._compact_lock:
+            with self._lock:
+                ranges = [(_first_id(name), self._segment_ends.get(name, self._next_id))
+                          for name in list(self._segments) + self._drained]
+                unacked = set(self._unacked)
+                self._acks_since = []
+
+            ack_path = os.path.join(self.directory, ACK_INDEX)
+            tmp_path = ack_path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for first, end in sorted(ranges):
+                        f.write("".join(f"{i}\n" for i in range(first, end) if i not in unacked))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    with self._lock:
+                        f.write("".join(f"{i}\n" for i in self._acks_since))
+                        f.flush()
+                        self._ack_file.close()
+                        os.replace(tmp_path, ack_path)
+                        self._ack_file = open(ack_path, "a", encoding="utf-8")
+                        self._acks_since = None
+                        self._stale_segments = 0
+                        self._last_rewrite = time.monotonic()
+                _fsync_dir(self.directory)
+            finally:
+                with self._lock:
+                    self._acks_since = None
+
+    def adopt(self, other: "CallbackOutbox") -> int:
+        """Moves every unacked record of `other` (e.g. the outbox of a worker
+        that is gone) into this outbox. Returns the number moved. A crash in
+        between leaves a record in both, never in neither."""
+        moved = []
+        for record_id, payload in other.pending():
+            self.append(payload)
+            moved.append(record_id)
+        self.sync()
+        for record_id in moved:
+            other.ack(record_id)
+        other.compact()
+        return len(moved)
+
+    # --- replay / inspection ---
+    @property
+    def next_id(self) -> int:
+        with self._lock:
+            return self._next_id
+
+    def pending(self, before_id: Optional[int] = None) -> Iterator[Tuple[int, Dict]]:
+        """Yields (id, payload) for every unacked record, oldest first.
+        With before_id, only records appended before that id are returned."""
+        with self._lock:
+            self._commit()
+            names = [n for n, unacked in self._segments.items() if unacked]
+            unacked_ids = {i for i in self._unacked if before_id is None or i < before_id}
+        for name in names:
+            for record in self._read_segment(name):
+                if record["id"] in unacked_ids:
+                    yield record["id"], record["payload"]
+
+    def backlog(self) -> Dict:
+        with self._lock:
+            oldest = min((ts for _, ts in self._unacked.values()), default=None)
+            total_bytes = 0
+            for name in self._segments:
+                try:
+                    total_bytes += os.path.getsize(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            return {
+                "pending": len(self._unacked),
+                "segments": len(self._segments),
+                "bytes": total_bytes,
+                "oldest_pending_age": (time.time() - oldest) if oldest is not None else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._flush_needed.notify()
+        self._flusher.join()
+        with self._lock:
+            self._commit()
+            self._segment_file.close()
+            self._ack_file.close()
+
+
+def main(argv=None):
+    """Inspect an outbox directory: python -m app.outbox DIR [--list]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("usage: python -m app.outbox DIR [--list]")
+        return 2
+    outbox = CallbackOutbox(argv[0])
+    try:
+        print(json.dumps(outbox.backlog(), indent=2))
+        if "--list" in argv:
+            for record_id, payload in outbox.pending():
+                print(record_id, json.dumps(payload))
+    finally:
+        outbox.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Pre-encoded JSON bodies for the /analyze-scam responses.
+
+FastAPI's default path runs every returned dict through jsonable_encoder
+(a recursive pure-Python walk) and then json.dumps. Here the constant parts
+of the body are encoded once: the key layout is a template and each reply
+string is JSON-escaped the first time it is used. A request only encodes
+its own values, the keyword and indicator lists, with the C string
+escaper. The result is the bytes the default path would have produced.
+
+The layout is checked against app.schemas.ScamResponse once at import, so
+a drift between the two fails at startup, not per request.
+"""
+from json.encoder import encode_basestring
+from typing import Dict, List, Optional
+
+from starlette.responses import Response
+
+from app.schemas import ScamResponse
+
+# Every value is a string, a list of strings, an int, a bool or None, so
+# the C string escaper covers it. It produces what starlette's
+# JSONResponse.render (ensure_ascii=False, compact separators) would, without
+# building a JSONEncoder per call.
+def _strings(values: Optional[List[str]]) -> str:
+    if values is None:
+        return "null"
+    return "[" + ",".join(map(encode_basestring, values)) + "]"
+
+
+def _string(value: Optional[str]) -> str:
+    return "null" if value is None else encode_basestring(value)
+
+
+_TEMPLATE = (
+    '{"status":"success","reply":%s,"is_scam":%s,"confidence_score":%d,"confidence_percentage":"%d%%",'
+    '"extracted_intelligence":{"upi_id":%s,"phone_number":%s,"phishing_link":%s,"suspicious_keywords":%s},'
+    '"explanation":%s,"campaign_id":%s}'
+)
+MAX_REPLY_TEMPLATES = 1024  # replies come from the rules file; reloads can add more
+
+_reply_json: Dict[str, str] = {}
+
+
+def _reply(reply: str) -> str:
+    encoded = _reply_json.get(reply)
+    if encoded is None:
+        if len(_reply_json) >= MAX_REPLY_TEMPLATES:
+            _reply_json.clear()
+        encoded = _reply_json[reply] = encode_basestring(reply)
+    return encoded
+
+
+def encode_analysis(reply: str, is_scam: bool, score: int, extracted: Dict[str, List[str]],
+                    keywords: List[str], campaign_id: Optional[str]) -> bytes:
+    """Body of a full /analyze-scam response."""
+    return (_TEMPLATE % (
+        _reply(reply),
+        "true" if is_scam else "false",
+        score,
+        score,
+        _strings(extracted.get("upiIds")),
+        _strings(extracted.get("phoneNumbers")),
+        _strings(extracted.get("phishingLinks")),
+        _strings(keywords),
+        encode_basestring(f"Risk score {score}% based on keywords: {keywords}"),
+        _string(campaign_id),
+    )).encode("utf-8")
+
+
+def encode_not_sure(reply: str) -> bytes:
+    """Body of the short fallback response (detection failed or timed out)."""
+    return ('{"status":"success","reply":%s,"is_scam":false}' % _reply(reply)).encode("utf-8")
+
+
+class AnalysisResponse(Response):
+    """A body that is already encoded JSON."""
+    media_type = "application/json"
+
+
+def _check_layout():
+    sample = encode_analysis("reply \"quoted\" é", True, 90, {"upiIds": ["a@ybl"], "phoneNumbers": [],
+                             "phishingLinks": ["http://x"]}, ["pay", "now"], "c1")
+    ScamResponse.model_validate_json(sample, strict=True)
+    ScamResponse.model_validate_json(encode_analysis("r", False, 0, {}, [], None), strict=True)
+    ScamResponse.model_validate_json(encode_not_sure("r"), strict=True)
+
+
+_check_layout()
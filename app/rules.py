@@ -0,0 +1,533 @@
+"""Declarative scoring and reply rules (app/rules.json), compiled once.
+
+The rules file holds the keyword categories, the score rules and the bait
+replies. load_rules() compiles it into a RuleEngine: one keyword regex plus
+one generated function for the score rules, plus the message normalizer
+(app.normalize) built from the keywords. "transliterations" maps romanized
+Hindi terms to the keyword they stand for ("paisa" -> "money"); they are
+indexed with the keywords, so one scan finds both. "leetspeak_flag_words"
+lists the words whose leet spellings ("p@y", "m0ney") set the "leetspeak"
+flag; other leet words are folded for matching only. reload() builds a new
+engine and then swaps a single module reference. Readers call current()
+once per message and use that engine for the whole message, so the hot
+path takes no lock and never mixes two rule sets.
+
+Score rule grammar, evaluated in file order:
+    {"if": COND, "add": N, "signal": "name", "then": [rules], "else": [rules]}
+Every key is optional; a rule without "if" always applies. "signal" adds a
+pseudo-keyword to suspicious_keywords.
+COND is a category name (it had a keyword hit), or one of
+    {"any": [COND...]}  {"all": [COND...]}  {"not": COND}
+    {"text": [substrings]}      any substring of the lowercased message
+    {"intel": [fields]}         any of these extracted_data fields is non-empty
+    {"min_keywords": N}         at least N unique keywords/signals so far
+    {"flag": [names]}           normalization undid any of these obfuscations
+                                ("leetspeak", "confusables")
+"""
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from app import normalize
+from app.normalize import NormalizedText
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+RULES_PATH = os.environ.get("RULES_PATH", DEFAULT_RULES_PATH)
+
+_WORD_CHAR_RE = re.compile(r'\w')
+
+
+class RulesError(ValueError):
+    """The rules file is malformed. The engine in use is left unchanged."""
+
+
+# --- KEYWORD ENGINE ---
+def _build_keyword_engine(categories: Dict[str, List[str]], transliterations: Dict[str, str]):
+    # Every keyword starts and ends with a word character, so a \b-bounded
+    # hit always begins at the start of a word. Index keywords by their first
+    # word and find candidate words with one combined regex. Entries are
+    # (text to find, keyword it counts as); transliterations count as their
+    # English keyword.
+    by_first_word = {}
+    for category, patterns in categories.items():
+        for p in patterns:
+            if not isinstance(p, str) or not p or not _WORD_CHAR_RE.match(p) or not _WORD_CHAR_RE.match(p[-1]):
+                raise RulesError(f"category {category!r}: keyword {p!r} must start and end with a word character")
+            if p != p.lower():
+                raise RulesError(f"category {category!r}: keyword {p!r} must be lowercase")
+            first_word = re.match(r'\w+', p).group(0)
+            by_first_word.setdefault(first_word, []).append((p, p))
+    keywords = {p for patterns in categories.values() for p in patterns}
+    for term, target in transliterations.items():
+        if not isinstance(term, str) or not term or term != term.lower() \
+                or not _WORD_CHAR_RE.match(term) or not _WORD_CHAR_RE.match(term[-1]):
+            raise RulesError(f"transliteration {term!r} must be lowercase and start and end with a word character")
+        if target not in keywords:
+            raise RulesError(f"transliteration {term!r}: {target!r} is not a keyword")
+        by_first_word.setdefault(re.match(r'\w+', term).group(0), []).append((term, target))
+    word_re = re.compile(r'\b' + _trie_pattern(by_first_word) + r'\b')
+    return word_re, by_first_word
+
+
+def _trie_pattern(words) -> str:
+    # Alternatives factored by common prefix ("pa(?:y|rcel)"): re tries one
+    # branch per character instead of every word. Optional tails are greedy,
+    # so the longest word still wins, as with a longest-first alternation.
+    trie: Dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if "" in node:
+            return "(?:" + "|".join(branches) + ")?"
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return build(trie)
+
+
+# --- RULE COMPILER ---
+# The score rules become the source of one Python function, the same if-chain
+# that used to be written by hand, so evaluating them costs no more than it
+# did. Only validated category names, ints and repr() string literals are
+# ever emitted.
+def _condition_source(spec, categories: Dict[str, List[str]], batch: bool = False) -> str:
+    # batch: the same condition over bitmasks, one bit per message (see BATCH SCORING)
+    if isinstance(spec, str):
+        if spec not in categories:
+            raise RulesError(f"unknown category {spec!r} in condition")
+        return f"hits[{spec!r}]"
+    if not isinstance(spec, dict) or len(spec) != 1:
+        raise RulesError(f"condition must be a category name or a one-key object, got {spec!r}")
+    (op, arg), = spec.items()
+    if op in ("any", "all"):
+        if not isinstance(arg, list) or not arg:
+            raise RulesError(f"{op!r} needs a non-empty list")
+        if batch:
+            joiner = " | " if op == "any" else " & "
+        else:
+            joiner = " or " if op == "any" else " and "
+        return "(" + joiner.join(_condition_source(c, categories, batch) for c in arg) + ")"
+    if op == "not":
+        inner = _condition_source(arg, categories, batch)
+        return f"(full & ~{inner})" if batch else f"(not {inner})"
+    if op == "text":
+        needles = _string_list(op, arg)
+        if batch:
+            return f"text({needles!r})"
+        return "(" + " or ".join(f"{n!r} in text" for n in needles) + ")"
+    if op == "intel":
+        fields = _string_list(op, arg)
+        if batch:
+            return "(" + " | ".join(f"extracted.get({f!r}, 0)" for f in fields) + ")"
+        return "(" + " or ".join(f"extracted.get({f!r})" for f in fields) + ")"
+    if op == "min_keywords":
+        n = _int(op, arg)
+        return f"counts.at_least({n})" if batch else f"(len(set(signals)) >= {n})"
+    if op == "flag":
+        names = _string_list(op, arg)
+        unknown = set(names) - normalize.FLAGS
+        if unknown:
+            raise RulesError(f"unknown flag {sorted(unknown)[0]!r}, expected one of {sorted(normalize.FLAGS)}")
+        if batch:
+            return "(" + " | ".join(f"flags.get({n!r}, 0)" for n in names) + ")"
+        return "(" + " or ".join(f"{n!r} in flags" for n in names) + ")"
+    raise RulesError(f"unknown condition {op!r}")
+
+
+def _string_list(op: str, arg) -> Tuple[str, ...]:
+    if not isinstance(arg, list) or not arg or not all(isinstance(s, str) for s in arg):
+        raise RulesError(f"{op!r} needs a non-empty list of strings")
+    return tuple(arg)
+
+
+def _int(op: str, arg) -> int:
+    if not isinstance(arg, int) or isinstance(arg, bool):
+        raise RulesError(f"{op!r} must be an integer, got {arg!r}")
+    return arg
+
+
+_RULE_KEYS = {"if", "add", "signal", "then", "else"}
+
+
+def _rules_source(specs, categories: Dict[str, List[str]], indent: int) -> List[str]:
+    if not isinstance(specs, list):
+        raise RulesError("rules must be a list")
+    pad = "    " * indent
+    lines = []
+    for spec in specs:
+        if not isinstance(spec, dict) or not set(spec) <= _RULE_KEYS:
+            raise RulesError(f"rule keys must be among {sorted(_RULE_KEYS)}, got {spec!r}")
+        body = []
+        if spec.get("add"):
+            body.append(f"score += {_int('add', spec['add'])}")
+        if "signal" in spec:
+            if not isinstance(spec["signal"], str):
+                raise RulesError(f"'signal' must be a string, got {spec['signal']!r}")
+            body.append(f"signals.append({spec['signal']!r})")
+        if "if" not in spec:
+            lines += [pad + line for line in body]
+            lines += _rules_source(spec.get("then", []), categories, indent)
+            continue
+        lines.append(f"{pad}if {_condition_source(spec['if'], categories)}:")
+        branch = len(lines)
+        lines += [pad + "    " + line for line in body]
+        lines += _rules_source(spec.get("then", []), categories, indent + 1)
+        if len(lines) == branch:
+            lines.append(pad + "    pass")
+        otherwise = _rules_source(spec.get("else", []), categories, indent + 1)
+        if otherwise:
+            lines.append(f"{pad}else:")
+            lines += otherwise
+    return lines
+
+
+def _compile_score_rules(specs, categories: Dict[str, List[str]]) -> Tuple[Callable, str]:
+    lines = ["def score_rules(hits, text, extracted, signals, flags):", "    score = 0"]
+    lines += _rules_source(specs, categories, 1)
+    lines.append("    return score")
+    source = "\n".join(lines) + "\n"
+    namespace: Dict = {}
+    exec(compile(source, "<rules>", "exec"), {"__builtins__": {"len": len, "set": set}}, namespace)
+    return namespace["score_rules"], source
+
+
+# --- BATCH SCORING ---
+# A batch of messages is scored as a message x keyword hit matrix. Each
+# column is a Python int used as a bitmask (bit i = message i), so every
+# condition and every rule is one bitwise operation for the whole batch.
+# Running totals (the score, the unique keyword count that min_keywords
+# tests) are bit-sliced: plane k holds bit k of every message's total.
+def iter_bits(mask: int) -> Iterator[int]:
+    """Indices of the set bits of `mask`, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class _BitCounter:
+    """One non-negative integer per message, stored as bit planes."""
+
+    def __init__(self, full: int):
+        self.full = full
+        self.planes: List[int] = []
+
+    def add(self, mask: int, value: int = 1):
+        """Adds `value` to every message in `mask` (ripple-carry, plane by plane)."""
+        bit = 0
+        while value and mask:
+            if value & 1:
+                carry, i = mask, bit
+                while carry:
+                    if i >= len(self.planes):
+                        self.planes.extend([0] * (i + 1 - len(self.planes)))
+                    self.planes[i], carry = self.planes[i] ^ carry, self.planes[i] & carry
+                    i += 1
+            value >>= 1
+            bit += 1
+
+    def at_least(self, n: int) -> int:
+        """Mask of the messages whose value is >= n."""
+        if n <= 0:
+            return self.full
+        greater, equal = 0, self.full
+        for i in reversed(range(max(len(self.planes), n.bit_length()))):
+            plane = self.planes[i] if i < len(self.planes) else 0
+            if n >> i & 1:
+                equal &= plane
+            else:
+                greater |= equal & plane
+                equal &= ~plane
+        return greater | equal
+
+    def values(self, count: int) -> List[int]:
+        totals = [0] * count
+        for i, plane in enumerate(self.planes):
+            weight = 1 << i
+            for j in iter_bits(plane):
+                totals[j] += weight
+        return totals
+
+
+def _batch_rules_source(specs, categories: Dict[str, List[str]], scope: str, ids: Iterator[int]) -> List[str]:
+    # Straight-line code: a rule's mask is its scope & its condition, an
+    # "else" gets scope & ~condition. The specs were validated by _rules_source.
+    lines = []
+    for spec in specs:
+        inner = scope
+        if "if" in spec:
+            k = next(ids)
+            lines.append(f"c{k} = {_condition_source(spec['if'], categories, batch=True)}")
+            lines.append(f"m{k} = {scope} & c{k}")
+            inner = f"m{k}"
+        if spec.get("add"):
+            add = spec["add"]
+            lines.append(f"score.add({inner}, {add})" if add > 0 else f"penalty.add({inner}, {-add})")
+        if "signal" in spec:
+            lines.append(f"signal({inner}, {spec['signal']!r})")
+        lines += _batch_rules_source(spec.get("then", []), categories, inner, ids)
+        if "if" in spec and spec.get("else"):
+            lines.append(f"e{k} = {scope} & ~c{k}")
+            lines += _batch_rules_source(spec["else"], categories, f"e{k}", ids)
+    return lines
+
+
+def _compile_batch_score_rules(specs, categories: Dict[str, List[str]]) -> Tuple[Callable, str]:
+    lines = ["def score_rules_batch(hits, text, extracted, flags, counts, signal, score, penalty, full):"]
+    lines += ["    " + line for line in _batch_rules_source(specs, categories, "full", itertools.count())]
+    lines.append("    return None")
+    source = "\n".join(lines) + "\n"
+    namespace: Dict = {}
+    exec(compile(source, "<rules-batch>", "exec"), {"__builtins__": {}}, namespace)
+    return namespace["score_rules_batch"], source
+
+
+class RuleEngine:
+    """A compiled rules file. Immutable once built, so it is safe to share."""
+
+    def __init__(self, spec: Dict, version: str = ""):
+        if not isinstance(spec, dict):
+            raise RulesError("rules file must hold a JSON object")
+        categories = spec.get("categories")
+        if not isinstance(categories, dict) or not categories:
+            raise RulesError("'categories' must be a non-empty object")
+        # Category order matters: suspicious keywords are collected in this order.
+        self.categories: Dict[str, List[str]] = {c: list(_string_list(c, p)) for c, p in categories.items()}
+        transliterations = spec.get("transliterations", {})
+        if not isinstance(transliterations, dict):
+            raise RulesError("'transliterations' must be an object")
+        self._word_re, self._by_first_word = _build_keyword_engine(self.categories, transliterations)
+        self._score_rules, self.source = _compile_score_rules(spec.get("score_rules", []), self.categories)
+        self._batch_score_rules, self.batch_source = _compile_batch_score_rules(
+            spec.get("score_rules", []), self.categories)
+        self.max_score = _int("max_score", spec.get("max_score", 100))
+        leet_flag_words = spec.get("leetspeak_flag_words", [])
+        if leet_flag_words:
+            leet_flag_words = _string_list("leetspeak_flag_words", leet_flag_words)
+        self.normalizer = normalize.Normalizer(
+            {w for entries in self._by_first_word.values() for p, _ in entries for w in re.findall(r'\w{2,}', p)},
+            leet_flag_words)
+
+        self._replies: List[Tuple[Tuple[str, ...], str]] = []
+        for reply in spec.get("replies", []):
+            try:
+                self._replies.append((_string_list("keywords", reply["keywords"]), str(reply["reply"])))
+            except (KeyError, TypeError) as e:
+                raise RulesError(f"reply needs 'keywords' and 'reply': {reply!r}") from e
+        self.default_reply = spec.get("default_reply", "")
+        self.fallback_reply = spec.get("fallback_reply", self.default_reply)
+        self.version = version
+        self.loaded_at = time.time()
+
+    def normalize(self, message: str) -> NormalizedText:
+        """Both views of `message` for this rule set (see app.normalize)."""
+        return self.normalizer(message)
+
+    def scan(self, text: str) -> Dict[str, List[str]]:
+        """Keyword hits per category for `text` (the normalized match view), in
+        one pass. Same hits as a \\b-bounded search for every keyword or a
+        transliteration of it."""
+        hits = set()
+        text_len = len(text)
+        for m in self._word_re.finditer(text):
+            start = m.start()
+            for p, keyword in self._by_first_word[m.group(0)]:
+                end = start + len(p)
+                if keyword in hits or not text.startswith(p, start):
+                    continue
+                if end < text_len and _WORD_CHAR_RE.match(text, end):
+                    continue
+                hits.add(keyword)
+        return self.hits(hits)
+
+    def hits(self, keywords) -> Dict[str, List[str]]:
+        """scan()'s result for a text whose keywords are already known."""
+        return {
+            category: [p for p in patterns if p in keywords]
+            for category, patterns in self.categories.items()
+        }
+
+    def score(self, text: str, hits: Dict[str, List[str]], extracted: Dict, signals: List[str],
+              flags: FrozenSet[str] = frozenset()) -> int:
+        """Runs the score rules. Appends rule signals to `signals` in place."""
+        return min(self._score_rules(hits, text, extracted, signals, flags), self.max_score)
+
+    def scan_batch(self, texts: List[str]) -> Dict[str, int]:
+        """scan() for many texts in one pass over their concatenation.
+        Returns keyword -> bitmask of the texts it was found in (bit i is
+        texts[i]). "\0" between texts is not a word character, so no hit
+        crosses from one text into the next."""
+        joined = "\0".join(texts)
+        starts = list(itertools.accumulate((len(t) + 1 for t in texts[:-1]), initial=0))
+        text_len = len(joined)
+        found: Dict[str, int] = {}
+        for m in self._word_re.finditer(joined):
+            start = m.start()
+            bit = 1 << (bisect.bisect_right(starts, start) - 1)
+            for p, keyword in self._by_first_word[m.group(0)]:
+                end = start + len(p)
+                if found.get(keyword, 0) & bit or not joined.startswith(p, start):
+                    continue
+                if end < text_len and _WORD_CHAR_RE.match(joined, end):
+                    continue
+                found[keyword] = found.get(keyword, 0) | bit
+        return found
+
+    def score_batch(self, texts: List[str], found: Dict[str, int], extracted: List[Dict],
+                    flags: List[FrozenSet[str]]) -> Tuple[List[int], List[List[str]]]:
+        """score() for every text of a batch at once, from scan_batch's
+        `found`. Returns the scores and each text's rule signals."""
+        count = len(texts)
+        full = (1 << count) - 1
+        joined = "\0".join(texts)
+        starts = list(itertools.accumulate((len(t) + 1 for t in texts), initial=0))
+
+        def text(needles: Tuple[str, ...]) -> int:
+            mask = 0
+            for needle in needles:
+                pos = joined.find(needle)
+                while pos != -1:
+                    i = bisect.bisect_right(starts, pos) - 1
+                    mask |= 1 << i
+                    pos = joined.find(needle, starts[i + 1]) if i + 1 < count else -1
+            return mask
+
+        hits = {category: 0 for category in self.categories}
+        counts = _BitCounter(full)
+        seen = dict(found)  # signal name -> messages that already have it
+        for category, patterns in self.categories.items():
+            for p in patterns:
+                hits[category] |= found.get(p, 0)
+        for mask in found.values():
+            counts.add(mask)
+        intel: Dict[str, int] = {}
+        flag_masks: Dict[str, int] = {}
+        for i, (data, names) in enumerate(zip(extracted, flags)):
+            for field, values in data.items():
+                if values:
+                    intel[field] = intel.get(field, 0) | 1 << i
+            for name in names:
+                flag_masks[name] = flag_masks.get(name, 0) | 1 << i
+
+        fired: List[Tuple[int, str]] = []
+
+        def signal(mask: int, name: str):
+            if mask:
+                fired.append((mask, name))
+                counts.add(mask & ~seen.get(name, 0))
+                seen[name] = seen.get(name, 0) | mask
+
+        score, penalty = _BitCounter(full), _BitCounter(full)
+        self._batch_score_rules(hits, text, intel, flag_masks, counts, signal, score, penalty, full)
+
+        signals: List[List[str]] = [[] for _ in range(count)]
+        for mask, name in fired:
+            for i in iter_bits(mask):
+                signals[i].append(name)
+        scores = [min(plus - minus, self.max_score)
+                  for plus, minus in zip(score.values(count), penalty.values(count))]
+        return scores, signals
+
+    def reply(self, keywords: List[str]) -> str:
+        """Bait reply for the first reply rule sharing a keyword with `keywords`."""
+        for triggers, reply in self._replies:
+            for k in triggers:
+                if k in keywords:
+                    return reply
+        return self.default_reply
+
+
+def load_rules(path: str) -> RuleEngine:
+    with open(path, "rb") as f:
+        raw = f.read()
+    try:
+        spec = json.loads(raw)
+    except ValueError as e:
+        raise RulesError(f"{path}: {e}") from e
+    return RuleEngine(spec, version=hashlib.blake2b(raw, digest_size=6).hexdigest())
+
+
+# --- ACTIVE ENGINE ---
+_engine: RuleEngine = load_rules(RULES_PATH)
+_reload_lock = threading.Lock()  # serializes reloads; readers never take it
+
+
+def current() -> RuleEngine:
+    return _engine
+
+
+def reload(path: Optional[str] = None) -> RuleEngine:
+    """Compiles `path` (default RULES_PATH) and swaps it in. On RulesError or
+    OSError the engine in use stays active and the error propagates."""
+    global _engine, RULES_PATH
+    with _reload_lock:
+        engine = load_rules(path or RULES_PATH)
+        _engine = engine  # one reference assignment: readers see old or new, never a mix
+        if path:
+            RULES_PATH = path
+    logger.info(f"Rules {engine.version} loaded from {path or RULES_PATH}")
+    return engine
+
+
+class RulesReloader:
+    """Polls the rules file's mtime and reloads it when it changes. Compiling
+    happens on this thread, off the request path. `on_reload(engine)` runs
+    after each successful swap (e.g. to clear caches of old results)."""
+
+    def __init__(self, interval: float = 2.0, on_reload: Optional[Callable[[RuleEngine], None]] = None):
+        self.interval = interval
+        self.on_reload = on_reload
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._mtime = self._current_mtime()
+
+    @staticmethod
+    def _current_mtime() -> Optional[int]:
+        try:
+            return os.stat(RULES_PATH).st_mtime_ns
+        except OSError:
+            return None
+
+    def check(self) -> bool:
+        """Reloads if the file changed since the last check. Returns True on a swap."""
+        mtime = self._current_mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            engine = reload()
+        except (OSError, RulesError) as e:
+            logger.error(f"Rules reload failed, keeping {_engine.version}: {e}")
+            return False
+        if self.on_reload:
+            self.on_reload(engine)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rules-reloader", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
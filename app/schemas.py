@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict, Any
 
 # --- REQUEST SCHEMA (MATCHING HACKATHON DOC) ---
@@ -15,17 +15,25 @@ class ScamRequest(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
 
 # --- RESPONSE SCHEMA ---
+# What /analyze-scam actually returns. app.responses writes these bodies
+# directly and checks its layout against this model once at import.
 class ExtractedIntelligence(BaseModel):
-    upi_id: Optional[str] = None
-    phone_number: Optional[str] = None
-    phishing_link: Optional[str] = None
+    model_config = ConfigDict(extra="forbid")
+
+    upi_id: Optional[List[str]] = None         # None when the message was empty
+    phone_number: Optional[List[str]] = None
+    phishing_link: Optional[List[str]] = None
     suspicious_keywords: List[str] = []
 
 class ScamResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     status: str  # REQUIRED by Hackathon doc ("success")
     reply: str   # REQUIRED by Hackathon doc
     is_scam: bool
-    confidence_score: int
-    confidence_percentage: str
-    extracted_intelligence: ExtractedIntelligence
-    explanation: str
\ No newline at end of file
+    # The fallback reply (detection failed or timed out) stops here
+    confidence_score: Optional[int] = None
+    confidence_percentage: Optional[str] = None
+    extracted_intelligence: Optional[ExtractedIntelligence] = None
+    explanation: Optional[str] = None
+    campaign_id: Optional[str] = None
@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+from app.detector import PATTERN_CATEGORIES
+
+INTEL_FIELDS = ("upiIds", "phoneNumbers", "phishingLinks", "bankAccounts")
+
+# Defaults sized for a single worker. Each session is a few hundred bytes
+# plus its intelligence strings.
+DEFAULT_MAX_SESSIONS = 50_000
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+MAX_ITEMS_PER_FIELD = 50
+
+
+class SessionState:
+    """Running aggregates for one conversation. Updated once per message."""
+
+    __slots__ = ("session_id", "message_count", "risk_score", "last_score",
+                 "category_hits", "keywords", "extracted", "last_seen", "size")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.message_count = 0
+        self.risk_score = 0
+        self.last_score = 0
+        self.category_hits: Dict[str, int] = {c: 0 for c in PATTERN_CATEGORIES}
+        self.keywords: Dict[str, None] = {}  # insertion-ordered set
+        self.extracted: Dict[str, Dict[str, None]] = {f: {} for f in INTEL_FIELDS}
+        self.last_seen = 0.0
+        self.size = 256 + len(session_id)
+
+    def apply(self, detection_result: Dict) -> int:
+        """Merges one message's detection result. Returns the bytes added."""
+        added = 0
+        score = detection_result.get("confidence", 0)
+        self.message_count += 1
+        self.last_score = score
+        # Cumulative risk: a conversation is as risky as its worst turn.
+        if score > self.risk_score:
+            self.risk_score = score
+
+        for category in detection_result.get("categories", []):
+            self.category_hits[category] = self.category_hits.get(category, 0) + 1
+
+        for k in detection_result.get("suspicious_keywords", []):
+            if k not in self.keywords:
+                self.keywords[k] = None
+                added += 48 + len(k)
+
+        extracted_data = detection_result.get("extracted_data") or {}
+        for field in INTEL_FIELDS:
+            seen = self.extracted[field]
+            for value in extracted_data.get(field, []):
+                if value not in seen and len(seen) < MAX_ITEMS_PER_FIELD:
+                    seen[value] = None
+                    added += 48 + len(value)
+
+        self.size += added
+        return added
+
+    def to_record(self) -> Dict:
+        """Plain-JSON form, for state shared between processes (app.shared_state)."""
+        return {
+            "message_count": self.message_count,
+            "risk_score": self.risk_score,
+            "last_score": self.last_score,
+            "category_hits": self.category_hits,
+            "keywords": list(self.keywords),
+            "extracted": {field: list(values) for field, values in self.extracted.items()},
+            "size": self.size,
+        }
+
+    @classmethod
+    def from_record(cls, session_id: str, record: Dict) -> "SessionState":
+        state = cls(session_id)
+        state.message_count = record["message_count"]
+        state.risk_score = record["risk_score"]
+        state.last_score = record["last_score"]
+        state.category_hits.update(record["category_hits"])
+        state.keywords = dict.fromkeys(record["keywords"])
+        for field, values in record["extracted"].items():
+            state.extracted[field] = dict.fromkeys(values)
+        state.size = record["size"]
+        return state
+
+    def intelligence(self) -> Dict[str, List[str]]:
+        intel = {field: list(values) for field, values in self.extracted.items()}
+        intel["suspiciousKeywords"] = list(self.keywords)
+        return intel
+
+    def to_agent_session_data(self) -> Dict:
+        """Shape expected by app.agent.generate_agent_reply."""
+        upi_ids = self.extracted["upiIds"]
+        links = self.extracted["phishingLinks"]
+        phones = self.extracted["phoneNumbers"]
+        return {
+            "risk_score": self.risk_score,
+            "extracted": {
+                "upi_id": next(iter(upi_ids), None),
+                "phishing_link": next(iter(links), None),
+                "phone_number": next(iter(phones), None),
+                "suspicious_keywords": list(self.keywords),
+            },
+        }
+
+
+class SessionStore:
+    """In-process session aggregates keyed by sessionId, with LRU + TTL
+    eviction and an approximate memory cap."""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def approx_bytes(self) -> int:
+        return self._bytes
+
+    def update(self, session_id: str, detection_result: Dict) -> SessionState:
+        """Folds one new message into the session. Cost is O(new message)."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None and now - state.last_seen > self.ttl_seconds:
+                self._drop(session_id)
+                state = None
+            if state is None:
+                state = SessionState(session_id)
+                self._sessions[session_id] = state
+                self._bytes += state.size
+            else:
+                self._sessions.move_to_end(session_id)
+
+            self._bytes += state.apply(detection_result)
+            state.last_seen = now
+            self._evict(now)
+            return state
+
+    def _drop(self, session_id: str):
+        state = self._sessions.pop(session_id)
+        self._bytes -= state.size
+        self.evictions += 1
+
+    def _evict(self, now: float):
+        # Oldest entries sit at the front; expired ones are always the oldest.
+        # The session just updated sits at the back and is never evicted here.
+        while len(self._sessions) > 1:
+            session_id, state = next(iter(self._sessions.items()))
+            over_limit = len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+            if not over_limit and now - state.last_seen <= self.ttl_seconds:
+                break
+            self._drop(session_id)
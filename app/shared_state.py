@@ -0,0 +1,284 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.intel_index import (
+    DEFAULT_MAX_INDICATORS,
+    MAX_SESSIONS_PER_INDICATOR,
+    _key,
+    _Posting,
+    normalize_indicator,
+)
+from app.session import DEFAULT_TTL_SECONDS, INTEL_FIELDS, SessionState
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_LOCAL = 10_000    # decoded sessions kept per process
+DEFAULT_BUSY_TIMEOUT = 5.0    # seconds a writer waits for another process's transaction
+PURGE_EVERY = 1000            # updates between expiry sweeps (per process)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    version    INTEGER NOT NULL,
+    updated    REAL NOT NULL,
+    state      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated);
+CREATE TABLE IF NOT EXISTS callback_reports (
+    session_id TEXT PRIMARY KEY,
+    msg_count  INTEGER NOT NULL,
+    sent_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS callback_reports_sent_at ON callback_reports(sent_at);
+CREATE TABLE IF NOT EXISTS intel (
+    indicator  BLOB PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen  REAL NOT NULL,
+    hits       INTEGER NOT NULL,
+    sessions   TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS intel_last_seen ON intel(last_seen);
+"""
+
+
+class _SharedDB:
+    """One SQLite file in WAL mode, one connection per thread."""
+
+    def __init__(self, path: str, busy_timeout: float = DEFAULT_BUSY_TIMEOUT):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._threads = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; handlers run on several threads.
+        conn = getattr(self._threads, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._threads.conn = conn
+        return conn
+
+
+class SharedSessionStore(_SharedDB):
+    """Session aggregates shared by every worker process on one host.
+
+    Drop-in for SessionStore when uvicorn runs several workers. The source
+    of truth is a SQLite database in WAL mode, so readers never block the
+    writer and a commit does not fsync (synchronous=NORMAL). Each process
+    keeps decoded SessionStates with the row version they came from. An
+    update reads the version inside its write transaction and decodes the
+    stored JSON only if another process changed the session since.
+
+    claim_report() gives cross-process callback dedup: only a report with a
+    higher message count than the last one sent for the session goes out.
+
+    update() and claim_report() write to the database and can wait up to
+    `busy_timeout` for another process's transaction, so async callers run
+    them in a thread.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_local: int = DEFAULT_MAX_LOCAL, busy_timeout: float = DEFAULT_BUSY_TIMEOUT):
+        self.ttl_seconds = ttl_seconds
+        self.max_local = max_local
+        self._local: "OrderedDict[str, Tuple[int, SessionState]]" = OrderedDict()
+        self._local_lock = threading.Lock()
+        self._updates = 0
+        self.local_hits = 0
+        self.local_misses = 0
+        self.purged = 0
+        super().__init__(path, busy_timeout)
+
+    def __len__(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        return self._conn().execute("SELECT count(*) FROM sessions WHERE updated >= ?", (cutoff,)).fetchone()[0]
+
+    def _cached(self, session_id: str, version: int) -> Optional[SessionState]:
+        with self._local_lock:
+            entry = self._local.get(session_id)
+            if entry is None or entry[0] != version:
+                self.local_misses += 1
+                return None
+            self._local.move_to_end(session_id)
+            self.local_hits += 1
+            return entry[1]
+
+    def _remember(self, session_id: str, version: int, state: SessionState):
+        with self._local_lock:
+            self._local[session_id] = (version, state)
+            self._local.move_to_end(session_id)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+    def _forget(self, session_id: str):
+        with self._local_lock:
+            self._local.pop(session_id, None)
+
+    def _load(self, session_id: str, row, now: float) -> Tuple[int, SessionState]:
+        if row is None:
+            return 0, SessionState(session_id)
+        version, updated, blob = row
+        if now - updated > self.ttl_seconds:
+            # Expired: start over, but keep the version moving so stale caches miss.
+            return version, SessionState(session_id)
+        state = self._cached(session_id, version)
+        if state is None:
+            state = SessionState.from_record(session_id, json.loads(blob))
+        return version, state
+
+    def update(self, session_id: str, detection_result: Dict) -> SessionState:
+        """Folds one new message into the session, atomically across processes."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT version, updated, state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            version, state = self._load(session_id, row, now)
+            state.apply(detection_result)
+            state.last_seen = time.monotonic()
+            conn.execute(
+                "INSERT INTO sessions (session_id, version, updated, state) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET "
+                "version = excluded.version, updated = excluded.updated, state = excluded.state",
+                (session_id, version + 1, now, json.dumps(state.to_record(), separators=(",", ":"))))
+            conn.execute("COMMIT")
+        except BaseException:
+            # The cached state may already hold this message; drop it.
+            self._forget(session_id)
+            conn.execute("ROLLBACK")
+            raise
+        self._remember(session_id, version + 1, state)
+
+        self._updates += 1
+        if self._updates % PURGE_EVERY == 0:
+            self.purge(now)
+        return state
+
+    def claim_report(self, session_id: str, msg_count: int) -> bool:
+        """True if this process should send the session's report for `msg_count`
+        messages, False if some worker already sent one at least as recent."""
+        cursor = self._conn().execute(
+            "INSERT INTO callback_reports (session_id, msg_count, sent_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET msg_count = excluded.msg_count, sent_at = excluded.sent_at "
+            "WHERE excluded.msg_count > callback_reports.msg_count",
+            (session_id, msg_count, time.time()))
+        return cursor.rowcount == 1
+
+    def purge(self, now: Optional[float] = None):
+        """Deletes sessions and report marks idle for longer than the TTL."""
+        cutoff = (time.time() if now is None else now) - self.ttl_seconds
+        conn = self._conn()
+        try:
+            deleted = conn.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM callback_reports WHERE sent_at < ?", (cutoff,))
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Session purge skipped: {e}")
+            return
+        self.purged += deleted
+
+    def stats(self) -> Dict:
+        with self._local_lock:
+            return {
+                "path": self.path,
+                "local_sessions": len(self._local),
+                "local_hits": self.local_hits,
+                "local_misses": self.local_misses,
+                "purged": self.purged,
+            }
+
+
+class SharedIntelIndex(_SharedDB):
+    """Drop-in for IntelIndex when uvicorn runs several workers: the
+    indicator postings live in the shared SQLite file, so /intel/lookup
+    gives the same answer whichever worker serves it and sees what every
+    worker recorded. Lookups are one primary-key read each. The file is
+    the persistent copy, so there is no snapshot to write or reload.
+
+    record() writes to the database and can wait up to `busy_timeout` for
+    another process's transaction, so async callers run it in a thread.
+    """
+
+    def __init__(self, path: str, max_indicators: int = DEFAULT_MAX_INDICATORS,
+                 busy_timeout: float = DEFAULT_BUSY_TIMEOUT):
+        self.max_indicators = max_indicators
+        self._records = 0
+        self.evictions = 0
+        super().__init__(path, busy_timeout)
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT count(*) FROM intel").fetchone()[0]
+
+    def record(self, session_id: str, extracted_data: Dict, ts: Optional[float] = None):
+        """Adds one message's extracted intelligence for `session_id`."""
+        ts = time.time() if ts is None else ts
+        keys = []
+        for field in INTEL_FIELDS:
+            for value in extracted_data.get(field) or ():
+                normalized = normalize_indicator(field, value)
+                if normalized:
+                    keys.append(_key(field, normalized))
+        if not keys:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key in keys:
+                row = conn.execute("SELECT hits, sessions FROM intel WHERE indicator = ?", (key,)).fetchone()
+                hits, sessions = (row[0], json.loads(row[1])) if row else (0, [])
+                if session_id in sessions:
+                    sessions.remove(session_id)
+                sessions.append(session_id)
+                del sessions[:-MAX_SESSIONS_PER_INDICATOR]
+                conn.execute(
+                    "INSERT INTO intel (indicator, first_seen, last_seen, hits, sessions) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(indicator) DO UPDATE SET "
+                    "last_seen = excluded.last_seen, hits = excluded.hits, sessions = excluded.sessions",
+                    (key, ts, ts, hits + 1, json.dumps(sessions, separators=(",", ":"))))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._records += 1
+        if self._records % PURGE_EVERY == 0:
+            self.purge()
+
+    def lookup(self, value: str, field: Optional[str] = None) -> List[Dict]:
+        """Every indicator matching `value`, in one field or all of them."""
+        fields = [field] if field else INTEL_FIELDS
+        conn = self._conn()
+        matches = []
+        for f in fields:
+            normalized = normalize_indicator(f, value)
+            if not normalized:
+                continue
+            row = conn.execute("SELECT first_seen, last_seen, hits, sessions FROM intel WHERE indicator = ?",
+                               (_key(f, normalized),)).fetchone()
+            if row is not None:
+                matches.append(_Posting(row[0], row[1], row[2], json.loads(row[3])).to_dict(f, normalized))
+        return matches
+
+    def purge(self):
+        """Past `max_indicators`, deletes the least recently seen indicators."""
+        conn = self._conn()
+        try:
+            excess = conn.execute("SELECT count(*) FROM intel").fetchone()[0] - self.max_indicators
+            if excess > 0:
+                conn.execute("DELETE FROM intel WHERE indicator IN "
+                             "(SELECT indicator FROM intel ORDER BY last_seen LIMIT ?)", (excess,))
+                self.evictions += excess
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Intel index purge skipped: {e}")
+
+    def stats(self) -> Dict:
+        return {"indicators": len(self), "path": self.path, "evictions": self.evictions}
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, List
+
+from starlette.responses import Response
+
+DEFAULT_MAX_LINE_BYTES = 2 * 1024 * 1024
+DEFAULT_FLUSH_BYTES = 64 * 1024
+
+
+class NDJSONStream(Response):
+    """ASGI response that analyzes an NDJSON request body as it arrives.
+
+    Each non-blank input line goes through `handle(line)`, which returns
+    the encoded result. Results are written in input order, one line per
+    record, and flushed whenever `flush_bytes` have built up or the input
+    runs dry, so the client sees them while it is still sending.
+
+    Flow control comes from reading and writing in one loop. The next body
+    chunk is only received after the results for the previous one were
+    sent, and uvicorn's send() waits while the client is not reading. A slow
+    reader therefore stalls intake and the TCP window pushes back on the
+    sender. Memory per stream is bounded by one chunk, one partial line
+    (at most `max_line_bytes`) and the pending output. `handle` may sleep
+    to throttle the stream, e.g. on a rate limit.
+
+    The body is read here, not by Starlette, so nothing else may call
+    receive() for this request.
+    """
+
+    media_type = "application/x-ndjson"
+    # Across all instances, for the metrics collector and the stream cap.
+    # Counted from construction, so two handlers cannot both pass a cap
+    # check before either stream has started.
+    open_streams = 0
+
+    def __init__(self, handle: Callable[[bytes], Awaitable[bytes]],
+                 max_line_bytes: int = DEFAULT_MAX_LINE_BYTES, flush_bytes: int = DEFAULT_FLUSH_BYTES):
+        self.handle = handle
+        self.max_line_bytes = max_line_bytes
+        self.flush_bytes = flush_bytes
+        self.records = 0
+        self.status_code = 200
+        self.background = None  # set by FastAPI
+        NDJSONStream.open_streams += 1
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await send({"type": "http.response.start", "status": self.status_code,
+                        "headers": [(b"content-type", self.media_type.encode())]})
+            await self._pump(receive, send)
+        finally:
+            NDJSONStream.open_streams -= 1
+        if self.background is not None:
+            await self.background()
+
+    async def _pump(self, receive, send):
+        pending = b""
+        out: List[bytes] = []
+        out_bytes = 0
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] != "http.request":
+                return  # client went away
+            more = message.get("more_body", False)
+            lines = (pending + message.get("body", b"")).split(b"\n")
+            pending = lines.pop() if more else b""
+
+            for line in lines:
+                if not line.strip():
+                    continue
+                result = await self.handle(line)
+                self.records += 1
+                out.append(result)
+                out.append(b"\n")
+                out_bytes += len(result) + 1
+                if out_bytes >= self.flush_bytes:
+                    await self._flush(send, out)
+                    out_bytes = 0
+
+            if len(pending) > self.max_line_bytes:
+                out.append(_error(f"Record longer than {self.max_line_bytes} bytes; stream closed"))
+                break
+            if out:
+                await self._flush(send, out)
+                out_bytes = 0
+        if out:
+            await self._flush(send, out)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    @staticmethod
+    async def _flush(send, out: List[bytes]):
+        await send({"type": "http.response.body", "body": b"".join(out), "more_body": True})
+        out.clear()
+        # Short records are scored inline and never await; let other requests run.
+        await asyncio.sleep(0)
+
+
+def _error(detail: str) -> bytes:
+    return json.dumps({"error": detail}).encode() + b"\n"
@@ -0,0 +1,73 @@
+"""Per-worker copies of files that uvicorn workers must not share.
+
+With `--workers N` every process runs the same setup against the same
+configured paths. Files a process owns outright (the callback outbox, the
+intel index snapshot) therefore get one copy per worker slot: slot 0 is
+the configured path itself, slot k is "<path>.<k>". A process claims the
+lowest slot whose "<slot path>.lock" it can flock. The kernel drops the
+lock when the process exits, so a restarted worker takes over the files
+its predecessor left, and the files of a slot nobody holds are orphans
+that another worker may adopt (see CallbackDispatcher.start).
+
+A single worker always gets slot 0, i.e. the configured path, unchanged.
+"""
+import fcntl
+import os
+import re
+from typing import List, Optional
+
+LOCK_SUFFIX = ".lock"
+
+
+def slot_path(base: str, slot: int) -> str:
+    return base if slot == 0 else f"{base}.{slot}"
+
+
+class WorkerSlot:
+    """A claimed slot. Held until release() or process exit."""
+
+    def __init__(self, base: str, slot: int, fd: int):
+        self.base = base
+        self.slot = slot
+        self.path = slot_path(base, slot)
+        self._fd: Optional[int] = fd
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)  # closing the descriptor drops the flock
+            self._fd = None
+
+
+def try_claim(base: str, slot: int) -> Optional[WorkerSlot]:
+    """Claims `slot` of `base` if no process (this one included) holds it."""
+    base = os.path.normpath(base)
+    fd = os.open(slot_path(base, slot) + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return WorkerSlot(base, slot, fd)
+
+
+def claim(base: str) -> WorkerSlot:
+    """Claims the lowest free slot of `base`."""
+    slot = 0
+    while True:
+        claimed = try_claim(base, slot)
+        if claimed is not None:
+            return claimed
+        slot += 1
+
+
+def existing_slots(base: str) -> List[int]:
+    """Slots of `base` whose files exist, whether or not a process holds them."""
+    base = os.path.normpath(base)
+    directory, name = os.path.split(base)
+    pattern = re.compile(re.escape(name) + r'\.(\d+)$')
+    slots = [0] if os.path.exists(base) else []
+    for entry in os.listdir(directory or "."):
+        match = pattern.match(entry)
+        if match and int(match.group(1)) > 0:
+            slots.append(int(match.group(1)))
+    return sorted(slots)
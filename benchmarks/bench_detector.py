@@ -0,0 +1,195 @@
+"""Micro-benchmarks for the detection hot path.
+
+    python -m benchmarks.bench_detector --out bench.json
+    python -m benchmarks.bench_detector --compare bench.json --threshold 0.10
+
+Reports ops/sec, p50/p99 latency and traced allocation bytes per message
+for each benchmark and corpus group. Throughput comes from timing the
+whole group as one batch, repeated until --min-time has passed, and
+ops/sec is the best of --repeat such measurements (the median is
+reported too). Many calls take under a microsecond, so timing each one
+alone would mostly measure the timer. p50/p99 come from one extra pass
+that does time each call; they are reported, not gated. In --compare
+mode the exit code is 1 when any benchmark's best throughput drops more
+than --threshold below the baseline file.
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from app.detector import (
+    PATTERN_CATEGORIES,
+    _match_patterns,
+    detect_scam_signals,
+    extract_intelligence_data,
+    normalize_message,
+)
+from app.main import generate_smart_reply
+from benchmarks.corpus import generate_corpus
+
+ALLOC_SAMPLE = 50        # messages per group traced for allocations (tracemalloc is slow)
+DEFAULT_REPEAT = 5       # throughput measurements per benchmark; the best one counts
+DEFAULT_MIN_TIME = 0.1   # seconds each measurement runs at least
+
+
+def _match_all_categories(text: str):
+    text = text.lower()
+    return [_match_patterns(text, patterns) for patterns in PATTERN_CATEGORIES.values()]
+
+
+def _build_cases(corpus: Dict[str, List[str]]) -> Dict[str, Callable]:
+    # suspicious_keywords comes out of a set, so its order (and the reply
+    # lookup's cost) would change with each process's hash seed. Sorted,
+    # the input is the same in every run.
+    keywords = {msg: sorted(detect_scam_signals(msg)["suspicious_keywords"])
+                for group in corpus.values() for msg in group}
+    return {
+        "detect_scam_signals": detect_scam_signals,
+        "normalize_message": normalize_message,
+        "extract_intelligence_data": extract_intelligence_data,
+        "_match_patterns": _match_all_categories,
+        "generate_smart_reply": lambda msg: generate_smart_reply(keywords[msg]),
+    }
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def _time_batch(fn: Callable, messages: List[str], min_time: float) -> float:
+    """Seconds per message: the whole batch timed at once, looped until min_time."""
+    loops = 0
+    start = time.perf_counter()
+    while True:
+        for msg in messages:
+            fn(msg)
+        loops += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / (loops * len(messages))
+
+
+def run_case(fn: Callable, messages: List[str], repeat: int = DEFAULT_REPEAT,
+             min_time: float = DEFAULT_MIN_TIME) -> Dict:
+    for msg in messages[:10]:
+        fn(msg)  # warm up caches and compiled patterns
+
+    # Like timeit: no collector pauses inside a measurement.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        per_msg = sorted(_time_batch(fn, messages, min_time) for _ in range(repeat))
+        timings = []
+        for msg in messages:
+            start = time.perf_counter_ns()
+            fn(msg)
+            timings.append(time.perf_counter_ns() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    timings.sort()
+
+    sample = messages[:ALLOC_SAMPLE]
+    tracemalloc.start()
+    alloc_bytes = 0
+    for msg in sample:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(msg)
+        alloc_bytes += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    return {
+        "messages": len(messages),
+        "measurements": repeat,
+        "ops_per_sec": 1 / per_msg[0] if per_msg[0] else 0.0,
+        "median_ops_per_sec": 1 / per_msg[len(per_msg) // 2] if per_msg[len(per_msg) // 2] else 0.0,
+        "p50_us": _percentile(timings, 0.50) / 1e3,
+        "p99_us": _percentile(timings, 0.99) / 1e3,
+        "alloc_bytes_per_msg": alloc_bytes / len(sample) if sample else 0.0,
+    }
+
+
+def run(repeat: int = DEFAULT_REPEAT, min_time: float = DEFAULT_MIN_TIME, seed: int = 1234,
+        groups: List[str] = None) -> Dict:
+    corpus = generate_corpus(seed=seed)
+    if groups:
+        corpus = {g: corpus[g] for g in groups}
+    results = {}
+    for name, fn in _build_cases(corpus).items():
+        for group, messages in corpus.items():
+            results[f"{name}/{group}"] = run_case(fn, messages, repeat, min_time)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "min_time": min_time,
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Returns one line per benchmark whose best throughput regressed past threshold."""
+    regressions = []
+    for name, base in baseline["results"].items():
+        now = current["results"].get(name)
+        if now is None or not base["ops_per_sec"]:
+            continue
+        change = now["ops_per_sec"] / base["ops_per_sec"] - 1
+        if change < -threshold:
+            regressions.append(f"{name}: {base['ops_per_sec']:.0f} -> {now['ops_per_sec']:.0f} ops/s ({change:+.1%})")
+    return regressions
+
+
+def _print_table(report: Dict):
+    print(f"{'benchmark':<48} {'ops/s':>12} {'median':>12} {'p50 us':>10} {'p99 us':>10} {'alloc B':>10}")
+    for name, r in report["results"].items():
+        print(f"{name:<48} {r['ops_per_sec']:>12.0f} {r.get('median_ops_per_sec', 0):>12.0f} "
+              f"{r['p50_us']:>10.1f} {r['p99_us']:>10.1f} {r['alloc_bytes_per_msg']:>10.0f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline results JSON to gate against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed throughput drop (default 0.10)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"throughput measurements per benchmark, best counts (default {DEFAULT_REPEAT})")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME,
+                        help=f"seconds per measurement (default {DEFAULT_MIN_TIME})")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--groups", nargs="*", help="only these corpus groups")
+    args = parser.parse_args(argv)
+
+    report = run(repeat=args.repeat, min_time=args.min_time, seed=args.seed, groups=args.groups)
+    _print_table(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nThroughput regressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Pathological-input benchmark for intelligence extraction.
+
+    python -m benchmarks.bench_extractor [--size 1048576] [--legacy]
+
+Times extract_intelligence_data on 1 MB payloads built to hurt regex
+scanners. --legacy also times the old uncompiled re.findall patterns.
+"""
+import argparse
+import re
+import sys
+import time
+
+from app.extractor import extract_intelligence_data
+
+# The patterns extract_intelligence_data used before app/extractor.py.
+LEGACY_PATTERNS = {
+    "upi": r'[a-zA-Z0-9.\-_]{2,256}@[a-zA-Z]{2,64}',
+    "phone": r'(?:\+91[\-\s]?)?[6-9]\d{9}',
+    "link": r'(https?://[^\s]+)|(www\.[^\s]+)',
+    "bank_ac": r'[0-9]{9,18}'
+}
+
+
+def legacy_extract(text: str):
+    return {
+        "upiIds": re.findall(LEGACY_PATTERNS["upi"], text),
+        "phoneNumbers": re.findall(LEGACY_PATTERNS["phone"], text),
+        "phishingLinks": [m[0] or m[1] for m in re.findall(LEGACY_PATTERNS["link"], text)],
+        "bankAccounts": re.findall(LEGACY_PATTERNS["bank_ac"], text)
+    }
+
+
+def payloads(size: int):
+    def fill(unit: str) -> str:
+        return (unit * (size // len(unit) + 1))[:size]
+    return {
+        "word_run_no_at": fill("a"),
+        "dotted_run_no_at": fill("a.b-c_"),
+        "digit_run": fill("7"),
+        "at_without_handle": fill("x@"),
+        "at_with_short_handle": fill("@ab"),
+        "repeated_upi": fill("pay to manager@upi "),
+        "repeated_phone": fill("+91 9876543210 "),
+        "url_run": fill("http://x.y/"),
+        "mixed_chatter": fill("Your KYC expired, pay 10rs to refund.desk@okaxis or call 9876543210 http://kyc.in "),
+    }
+
+
+def _time(fn, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1024 * 1024, help="payload size in characters")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy", action="store_true", help="also time the old re.findall patterns")
+    args = parser.parse_args(argv)
+
+    header = f"{'payload':<24} {'extract ms':>12}"
+    if args.legacy:
+        header += f" {'legacy ms':>12}"
+    print(header)
+    worst = 0.0
+    for name, text in payloads(args.size).items():
+        elapsed = _time(extract_intelligence_data, text, args.repeat)
+        worst = max(worst, elapsed)
+        line = f"{name:<24} {elapsed * 1e3:>12.1f}"
+        if args.legacy:
+            line += f" {_time(legacy_extract, text, 1) * 1e3:>12.1f}"
+        print(line)
+    print(f"\nworst case: {worst * 1e3:.1f} ms for {args.size} chars")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Overhead of the hot-path instrumentation in app.metrics.
+
+    python -m benchmarks.bench_metrics [--n 20000]
+
+Times the primitive operations (one observe, one inc), then runs the
+in-process analyze path over the synthetic corpus twice: once as shipped
+and once with every histogram/counter call replaced by a no-op. It reports
+the per-request difference.
+"""
+import argparse
+import sys
+import time
+
+from app import metrics
+from app.main import AnalysisRequest, _analyze_request, _detect, callback_coalescer
+from benchmarks.corpus import generate_corpus
+
+
+def _per_call_ns(fn, n: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter_ns() - start) / n
+
+
+def _requests(n: int):
+    corpus = generate_corpus(per_category=40, benign=200, long_messages=0, adversarial=0)
+    texts = [t for group in corpus.values() for t in group]
+    return [
+        AnalysisRequest(sessionId=f"bench-{i % 500}",
+                        message={"text": texts[i % len(texts)], "sender": "scammer", "timestamp": 0})
+        for i in range(n)
+    ]
+
+
+def _run_path(requests, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        for r in requests:
+            _analyze_request(r, *_detect(r.message.text))
+        best = min(best, (time.perf_counter_ns() - start) / len(requests))
+    return best
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20000, help="requests per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    hist = metrics.Histogram("bench_seconds", "bench", ("stage",))
+    counter = metrics.Counter("bench_total", "bench", ("verdict",))
+    print(f"histogram.observe   {_per_call_ns(lambda: hist.observe(0.0003, 'detect'), 200_000):8.0f} ns")
+    print(f"counter.inc         {_per_call_ns(lambda: counter.inc('scam'), 200_000):8.0f} ns")
+    print(f"perf_counter()      {_per_call_ns(metrics.now, 200_000):8.0f} ns")
+
+    # Keep callbacks off the network; the coalescer has no ticker here.
+    callback_coalescer.offer = lambda *args, **kwargs: None
+    requests = _requests(args.n)
+    _run_path(requests, 1)  # warm the detection cache and session store
+
+    instrumented = _run_path(requests, args.rounds)
+
+    originals = {}
+    for metric in metrics.REGISTRY._metrics:
+        for name in ("observe", "inc"):
+            if hasattr(metric, name):
+                originals[(metric, name)] = getattr(metric, name)
+                setattr(metric, name, lambda *args, **kwargs: None)
+    try:
+        bare = _run_path(requests, args.rounds)
+    finally:
+        for (metric, name), fn in originals.items():
+            setattr(metric, name, fn)
+
+    overhead = instrumented - bare
+    print(f"\nanalyze path, metrics on   {instrumented / 1e3:8.2f} us/request")
+    print(f"analyze path, metrics off  {bare / 1e3:8.2f} us/request")
+    print(f"overhead                   {overhead / 1e3:8.2f} us/request ({overhead / bare:+.1%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Cost of building and encoding one /analyze-scam response body.
+
+    python -m benchmarks.bench_response [--n 20000] [--rounds 5]
+
+Detection results for the synthetic corpus are turned into response bodies
+three ways:
+  dict      the response dict run through jsonable_encoder and
+            JSONResponse, as FastAPI did before app.responses
+  model     validating the dict into app.schemas.ScamResponse and dumping
+            it (a typed response_model, checked on every request)
+  template  app.responses.encode_analysis
+Reports ns and traced allocated bytes per response. It first checks that
+all three produce the same JSON; the exit code is 1 if they do not.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.detector import detect_scam_signals
+from app.main import generate_smart_reply
+from app.responses import encode_analysis
+from app.schemas import ScamResponse
+from benchmarks.corpus import generate_corpus
+
+ALLOC_SAMPLE = 500  # responses traced for allocations (tracemalloc is slow)
+
+
+def _legacy_dict(reply: str, is_scam: bool, score: int, extracted: Dict, keywords: List[str], campaign_id):
+    # The dict _analyze_request returned before app.responses
+    return {
+        "status": "success",
+        "reply": reply,
+        "is_scam": is_scam,
+        "confidence_score": score,
+        "confidence_percentage": f"{score}%",
+        "extracted_intelligence": {
+            "upi_id": extracted.get("upiIds"),
+            "phone_number": extracted.get("phoneNumbers"),
+            "phishing_link": extracted.get("phishingLinks"),
+            "suspicious_keywords": keywords
+        },
+        "explanation": f"Risk score {score}% based on keywords: {keywords}",
+        "campaign_id": campaign_id
+    }
+
+
+def dict_path(*args) -> bytes:
+    return JSONResponse(jsonable_encoder(_legacy_dict(*args))).body
+
+
+def model_path(*args) -> bytes:
+    return ScamResponse.model_validate(_legacy_dict(*args)).model_dump_json().encode("utf-8")
+
+
+PATHS: Dict[str, Callable[..., bytes]] = {"dict": dict_path, "model": model_path, "template": encode_analysis}
+
+
+def _inputs() -> List[tuple]:
+    corpus = generate_corpus(long_messages=0, adversarial=0)
+    inputs = []
+    for i, text in enumerate(t for group in corpus.values() for t in group):
+        result = detect_scam_signals(text)
+        score = result["confidence"]
+        keywords = result["suspicious_keywords"]
+        inputs.append((generate_smart_reply(keywords), score > 60, score, result["extracted_data"], keywords,
+                       f"c{i % 50:015x}" if i % 3 else None))
+    return inputs
+
+
+def _time(fn: Callable, inputs: List[tuple], n: int, rounds: int) -> float:
+    batch = [inputs[i % len(inputs)] for i in range(n)]
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        for args in batch:
+            fn(*args)
+        best = min(best, (time.perf_counter_ns() - start) / n)
+    return best
+
+
+def _alloc(fn: Callable, inputs: List[tuple]) -> float:
+    sample = inputs[:ALLOC_SAMPLE]
+    tracemalloc.start()
+    try:
+        total = 0
+        for args in sample:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn(*args)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(sample)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20000, help="responses per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    inputs = _inputs()
+    for item in inputs:
+        bodies = {name: json.loads(fn(*item)) for name, fn in PATHS.items()}
+        if bodies["template"] != bodies["dict"] or bodies["template"] != bodies["model"]:
+            print(f"bodies differ for {item!r}: {bodies}", file=sys.stderr)
+            return 1
+        if encode_analysis(*item) != dict_path(*item):
+            print(f"template bytes differ from the dict path for {item!r}", file=sys.stderr)
+            return 1
+
+    baseline = None
+    print(f"{'path':10s}{'ns/response':>14s}{'alloc B/response':>18s}")
+    for name, fn in PATHS.items():
+        ns = _time(fn, inputs, args.n, args.rounds)
+        baseline = baseline or ns
+        print(f"{name:10s}{ns:14,.0f}{_alloc(fn, inputs):18,.0f}   {baseline / ns:5.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Synthetic message corpus for the detector benchmarks.
+
+Deterministic for a given seed so runs are comparable.
+"""
+import random
+from typing import Dict, List
+
+from app.detector import PATTERN_CATEGORIES
+
+FILLER = ["please", "sir", "your", "the", "is", "for", "we", "have", "this", "and", "will", "you",
+          "with", "madam", "kindly", "dear", "customer", "number", "at", "to", "of"]
+BENIGN = [
+    "Hey, are we still meeting for lunch tomorrow?",
+    "Can you send me the notes from class?",
+    "Happy birthday! Hope you have a great year ahead.",
+    "The train is running late, will reach by 7.",
+    "Did you watch the match last night? What a finish.",
+    "Mom says dinner is ready, come home soon.",
+    "I'll call you after the meeting ends.",
+    "Thanks for the recipe, it turned out really well.",
+]
+# Obfuscated spellings with known verdicts (see benchmarks.rules_parity).
+# Chat uses leetspeak too, so folding alone must not make a message a scam.
+OBFUSCATED_BENIGN = [
+    "pls help, I'm at h0me n0w",
+    "c u at h0me t0day",
+    "gr8 g4me l4st night, c u 2m0rr0w",
+    "n0 w0rries, t4ke y0ur time",
+    "Καλημέρα, τι κάνεις;",
+    "Привет, как дела? Позвони мне",
+    "как",
+]
+OBFUSCATED_SCAM = [
+    "Update your ΚΥС today or your account will be blocked. Pay at http://kyc-update.in",
+    "Your ΚΥС has expired. Ѕеnd dеtаіlѕ to raju@ybl",
+    "URGENT: your ЅВІ ассount is blосkеd, verify now at raju@ybl",
+    "p@y the fine now or face arrest",
+    "send m0ney to 9876543210 immediately, your son had an accident",
+    "j0b offer: earn 5000 daily, join telegram now",
+    "Your bank ΡΙΝ expires today, share it now to avoid penalty",
+]
+INTEL = ["manager@upi", "refund.desk@okaxis", "9876543210", "+91 9123456789",
+         "http://update-kyc-bank.com/login", "www.claim-prize.in/win", "123456789012"]
+
+
+def _scam_message(rng: random.Random, category: str) -> str:
+    words = rng.sample(PATTERN_CATEGORIES[category], k=min(3, len(PATTERN_CATEGORIES[category])))
+    words += rng.sample(PATTERN_CATEGORIES["urgency"], k=2)
+    words += rng.choices(FILLER, k=8)
+    if rng.random() < 0.6:
+        words.append(rng.choice(INTEL))
+    rng.shuffle(words)
+    return " ".join(words).capitalize() + "."
+
+
+def _long_message(rng: random.Random, size: int) -> str:
+    parts = []
+    total = 0
+    while total < size:
+        part = rng.choice(BENIGN) if rng.random() < 0.7 else _scam_message(rng, rng.choice(list(PATTERN_CATEGORIES)))
+        parts.append(part)
+        total += len(part) + 1
+    return " ".join(parts)[:size]
+
+
+def _adversarial(rng: random.Random) -> str:
+    kind = rng.randrange(6)
+    if kind == 0:
+        # Long word-character run with no "@": worst case for the UPI regex
+        return "a" * rng.randint(2_000, 20_000)
+    if kind == 1:
+        # Long digit run: phone and bank account patterns overlap everywhere
+        return "".join(rng.choice("0123456789") for _ in range(rng.randint(1_000, 10_000)))
+    if kind == 2:
+        # Near-miss keywords that must not match on word boundaries
+        return " ".join(rng.choice(["nowhere", "known", "payday", "banking", "finest", "wonder", "sonnet"])
+                        for _ in range(500))
+    if kind == 3:
+        # Many "@" without a valid handle around them
+        return " ".join("x@" * rng.randint(1, 5) for _ in range(2_000))
+    if kind == 4:
+        # Unicode and leetspeak noise
+        return " ".join(rng.choice(["p@y", "m0ney", "j0b", "kÿc", "ʙᴀɴᴋ", "नमस्ते", "🙏"]) for _ in range(1_000))
+    return " ".join(rng.choice(["http://", "www.", "https://a", "@@", "+91"]) for _ in range(2_000))
+
+
+def generate_corpus(seed: int = 1234, per_category: int = 50, benign: int = 200,
+                    long_messages: int = 10, adversarial: int = 30) -> Dict[str, List[str]]:
+    """Returns messages grouped by kind: one group per scam category, plus
+    "benign", "long" (10-100 KB) and "adversarial"."""
+    rng = random.Random(seed)
+    corpus = {}
+    for category in PATTERN_CATEGORIES:
+        corpus[category] = [_scam_message(rng, category) for _ in range(per_category)]
+    corpus["benign"] = [rng.choice(BENIGN) for _ in range(benign)]
+    corpus["long"] = [_long_message(rng, rng.randint(10_000, 100_000)) for _ in range(long_messages)]
+    corpus["adversarial"] = [_adversarial(rng) for _ in range(adversarial)]
+    return corpus
@@ -0,0 +1,86 @@
+"""Parity check: the single-pass keyword scan against _match_patterns.
+
+    python -m benchmarks.keyword_parity [--rules app/rules.json] [--fuzz 20000]
+
+RuleEngine.scan finds every keyword of every category in one pass over
+the text. This checks it against the reference, detector._match_patterns
+(one \\b-bounded re.search per keyword), on the synthetic corpus plus
+random keyword mixes built to stress word boundaries: keywords glued to
+letters, digits, "_", "@" and non-ASCII letters, and keywords that share
+a first word ("bank" / "bank manager"). A transliteration counts as a hit
+for its keyword, as the scan documents. The exit code is 1 on any
+mismatch.
+"""
+import argparse
+import random
+import sys
+from typing import Dict, List
+
+from app import rules
+from app.detector import _match_patterns
+from benchmarks.corpus import generate_corpus
+
+_GLUE = [" ", " ", " ", ", ", ". ", "-", "_", "", "@", "/", "'", "1", "é", "\n"]
+_AFFIXES = ["", "", "", "s", "ing", "re", "x", "_", "9", "é", "ß"]
+
+
+def expected_hits(engine: rules.RuleEngine, aliases: Dict[str, List[str]], text: str) -> Dict[str, List[str]]:
+    """What scan() must return: _match_patterns for each keyword or any of its transliterations."""
+    return {
+        category: [p for p in patterns if _match_patterns(text, [p] + aliases.get(p, []))]
+        for category, patterns in engine.categories.items()
+    }
+
+
+def fuzz_messages(engine: rules.RuleEngine, aliases: Dict[str, List[str]], n: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    vocab = [k for patterns in engine.categories.values() for k in patterns]
+    vocab += [a for terms in aliases.values() for a in terms]
+    messages = []
+    for _ in range(n):
+        words = []
+        for _ in range(rng.randint(0, 8)):
+            word = rng.choice(vocab)
+            if rng.random() < 0.3:
+                word = rng.choice(_AFFIXES) + word + rng.choice(_AFFIXES)
+            if rng.random() < 0.1:
+                word = word.upper()
+            words.append(word)
+        message = ""
+        for word in words:
+            message += word + rng.choice(_GLUE)
+        messages.append(message)
+    return messages
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", help="rules file to check (default: the one in use)")
+    parser.add_argument("--fuzz", type=int, default=20000, help="random keyword mixes to scan")
+    args = parser.parse_args(argv)
+    if args.rules:
+        rules.reload(args.rules)
+    engine = rules.current()
+    aliases: Dict[str, List[str]] = {}
+    for entries in engine._by_first_word.values():
+        for term, keyword in entries:
+            if term != keyword:
+                aliases.setdefault(keyword, []).append(term)
+
+    corpus = generate_corpus()
+    messages = [m for group in corpus.values() for m in group] + fuzz_messages(engine, aliases, args.fuzz)
+    mismatches = 0
+    for message in messages:
+        text = message.lower()
+        got, want = engine.scan(text), expected_hits(engine, aliases, text)
+        if got != want:
+            mismatches += 1
+            if mismatches <= 20:
+                diffs = [f"{c}: {want[c]} -> {got[c]}" for c in want if got[c] != want[c]]
+                print(f"{message[:80]!r}: {'; '.join(diffs)}")
+    print(f"{len(messages)} messages, {mismatches} mismatches (rules {engine.version})")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""Parity check: app/rules.json against the hand-written scorer it replaced.
+
+    python -m benchmarks.rules_parity [--rules app/rules.json] [--fuzz 20000]
+
+Scores the synthetic corpus plus random keyword mixes with both the rule
+engine and the legacy if-chain kept below. It compares confidence,
+keyword set, categories and the bait reply. The exit code is 1 on any
+mismatch, so run it after editing the rules file to see how the change
+moves scores. Messages in which normalization undid an obfuscation
+(leetspeak, lookalikes, Hinglish) are rescored on purpose: they are not
+compared field by field, but every one whose verdict flips is counted.
+The labelled obfuscated messages in benchmarks.corpus must keep their
+verdict (benign chat stays benign, disguised scams are caught); a wrong
+verdict also exits 1.
+"""
+import argparse
+import random
+import re
+import sys
+from typing import Dict, List
+
+from app import rules
+from app.detector import detect_scam_signals
+from app.extractor import extract_intelligence_data
+from benchmarks.corpus import OBFUSCATED_BENIGN, OBFUSCATED_SCAM, generate_corpus
+
+# --- LEGACY SCORER (detect_scam_signals / generate_smart_reply before app/rules.json) ---
+LEGACY_CATEGORIES = {
+    "urgency": ["urgent", "immediately", "now", "today", "within 24 hours", "expire", "verify", "kyc", "action required", "deadline", "alert", "final notice"],
+    "authority": ["police", "court", "rbi", "income tax", "official", "cbi", "officer", "bank manager", "cyber cell", "enforcement", "judge"],
+    "financial": ["pay", "upi", "amount", "transfer", "refund", "deposit", "fee", "bank", "account", "credit", "debit", "wallet", "pin", "details", "balance", "money", "cash", "loan"],
+    "threat": ["jail", "arrest", "suspend", "suspended", "disconnect", "illegal", "case file", "warrant", "legal action", "fir", "fine", "penalty", "block", "blocked", "cut off", "detain", "prosecute"],
+    "lottery": ["lottery", "won", "prize", "congratulations", "claim", "winner", "lucky", "cash reward", "crore", "lakh", "jackpot"],
+    "impersonation": ["mom", "dad", "son", "daughter", "accident", "hospital", "lost phone", "new number", "emergency", "help", "friend", "family"],
+    "job": ["hiring", "part time", "part-time", "wfh", "work from home", "salary", "daily income", "earn", "telegram", "hr", "vacancy", "job offer"],
+    "utility": ["electricity", "power", "bill", "consumer number", "light", "connection", "meter", "update"],
+    "digital_arrest": ["narcotics", "drugs", "parcel", "fedex", "customs", "seized", "statement", "money laundering", "aadhaar"],
+    "investment": ["invest", "trading", "stock", "market", "crypto", "bitcoin", "returns", "profit", "double", "vip group", "whatsapp group", "guidance", "tips"],
+    "sextortion": ["viral", "video call", "leak", "exposure", "footage", "clip", "upload", "youtube", "social media", "reputation", "private video"],
+}
+
+
+def _match(text: str, patterns: List[str]) -> List[str]:
+    return [p for p in patterns if re.search(r'\b' + re.escape(p) + r'\b', text)]
+
+
+def legacy_detect(message: str) -> Dict:
+    if not message:
+        return {"confidence": 0, "suspicious_keywords": [], "categories": []}
+    text = message.lower()
+    hits = {c: _match(text, p) for c, p in LEGACY_CATEGORIES.items()}
+    urgency, authority, financial, threat = hits["urgency"], hits["authority"], hits["financial"], hits["threat"]
+    lottery, impersonation, job, utility = hits["lottery"], hits["impersonation"], hits["job"], hits["utility"]
+    digital_arrest, investment, sextortion = hits["digital_arrest"], hits["investment"], hits["sextortion"]
+    found_signals = [k for found in hits.values() for k in found]
+
+    score = 0
+    if authority: score += 30
+    if threat: score += 40
+    if lottery: score += 50
+    if sextortion: score += 50
+    if digital_arrest:
+        score += 40
+        if authority or threat: score += 30
+    if investment:
+        score += 30
+        if "whatsapp" in text or "telegram" in text or "double" in text: score += 30
+    if job:
+        score += 30
+        if "telegram" in text or "daily" in text or "5000" in text: score += 30
+    if utility:
+        if threat: score += 50
+        elif urgency and financial: score += 10
+    if impersonation:
+        if financial and urgency: score += 60
+        elif "hospital" in text or "accident" in text: score += 60
+        else: score += 10
+    if "p@y" in text or "m0ney" in text or "j0b" in text:
+        score += 50
+        found_signals.append("leetspeak_detected")
+    if not (utility or job or investment or digital_arrest):
+        if financial and urgency: score += 40
+        elif financial: score += 20
+        elif urgency: score += 10
+
+    extracted_data = extract_intelligence_data(message)
+    has_risky_data = bool(extracted_data["upiIds"] or extracted_data["phoneNumbers"] or extracted_data["phishingLinks"])
+    if has_risky_data and (urgency or threat):
+        score += 30
+    unique_keywords = list(set(found_signals))
+    if len(unique_keywords) >= 3: score += 10
+    return {
+        "confidence": min(score, 100),
+        "suspicious_keywords": unique_keywords,
+        "categories": [c for c, found in hits.items() if found],
+    }
+
+
+def legacy_reply(keywords: List[str]) -> str:
+    if any(k in keywords for k in ["arrest", "cbi", "police", "drugs", "customs", "seized", "narcotics"]):
+        return "Sir, please don't arrest me! I am a law-abiding citizen. I am very scared. What is the procedure to clear this? I can pay whatever fine."
+    if any(k in keywords for k in ["video", "viral", "leak", "youtube", "private", "footage", "upload"]):
+        return "Please, I beg you, do not share that video! My family will kill me. Tell me what to do, I will pay you right now."
+    if any(k in keywords for k in ["lottery", "won", "prize", "congratulations", "lakh", "crore"]):
+        return "Omg is this real?? I really need this money right now. I don't have a bank account, can I use my friend's UPI? What details do you need?"
+    if any(k in keywords for k in ["hiring", "job", "wfh", "salary", "earn", "telegram", "daily"]):
+        return "I am interested! I lost my job recently and really need this income. Do I have to pay any registration fee? I can start immediately."
+    if any(k in keywords for k in ["electricity", "bill", "disconnect", "power", "cut off"]):
+        return "Wait, I thought I paid it? Please don't cut the power, my mom is on oxygen support. How do I update it immediately?"
+    if any(k in keywords for k in ["mom", "dad", "hospital", "emergency", "accident"]):
+        return "Oh my god, are you okay? I am panicking. I can't call right now, just text me the UPI ID. How much do you need?"
+    if any(k in keywords for k in ["invest", "profit", "crypto", "double", "returns"]):
+        return "That sounds like a great return. Is it safe? I have 10,000 rs to invest right now. How do I join the group?"
+    return "I am not sure I understand. Can you explain clearly what I need to do? I am ready to cooperate."
+
+
+SCAM_THRESHOLD = 60  # is_scam = confidence > 60, as in app.main
+
+# --- INPUTS ---
+_EXTRAS = ["p@y", "m0ney", "j0b", "whatsapp", "daily", "5000", "hospital", "accident", "double",
+           "pay to raju@ybl", "call 9876543210", "http://kyc-update.in", "hello", "thanks", "ok"]
+
+
+def fuzz_messages(n: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    vocab = [k for patterns in LEGACY_CATEGORIES.values() for k in patterns] + _EXTRAS
+    messages = []
+    for _ in range(n):
+        words = rng.sample(vocab, k=rng.randint(0, 6))
+        words = [w.upper() if rng.random() < 0.1 else w for w in words]
+        messages.append(rng.choice([" ", ", ", ". ", "! "]).join(words))
+    return messages
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", help="rules file to check (default: the one in use)")
+    parser.add_argument("--fuzz", type=int, default=20000, help="random keyword mixes to score")
+    args = parser.parse_args(argv)
+    if args.rules:
+        rules.reload(args.rules)
+    engine = rules.current()
+
+    corpus = generate_corpus()
+    messages = [m for group in corpus.values() for m in group] + fuzz_messages(args.fuzz)
+    mismatches = rescored = flipped = 0
+    for message in messages:
+        new, old = detect_scam_signals(message), legacy_detect(message)
+        if engine.normalize(message).flags:
+            rescored += 1
+            flipped += (new["confidence"] > SCAM_THRESHOLD) != (old["confidence"] > SCAM_THRESHOLD)
+            continue
+        diffs = []
+        if new["confidence"] != old["confidence"]:
+            diffs.append(f"confidence {old['confidence']} -> {new['confidence']}")
+        if set(new["suspicious_keywords"]) != set(old["suspicious_keywords"]):
+            diffs.append(f"keywords {sorted(old['suspicious_keywords'])} -> {sorted(new['suspicious_keywords'])}")
+        if new["categories"] != old["categories"]:
+            diffs.append(f"categories {old['categories']} -> {new['categories']}")
+        if engine.reply(new["suspicious_keywords"]) != legacy_reply(old["suspicious_keywords"]):
+            diffs.append("reply differs")
+        if diffs:
+            mismatches += 1
+            if mismatches <= 20:
+                print(f"{message[:80]!r}: {'; '.join(diffs)}")
+
+    wrong = 0
+    for expected, labelled in ((False, OBFUSCATED_BENIGN), (True, OBFUSCATED_SCAM)):
+        for message in labelled:
+            confidence = detect_scam_signals(message)["confidence"]
+            if (confidence > SCAM_THRESHOLD) != expected:
+                wrong += 1
+                print(f"{message[:80]!r}: scored {confidence}, expected {'scam' if expected else 'benign'}")
+    print(f"{len(messages)} messages, {mismatches} mismatches, {rescored} rescored by normalization "
+          f"({flipped} verdicts flipped), {wrong} wrong verdicts on labelled obfuscations (rules {engine.version})")
+    return 1 if mismatches or wrong else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,31 @@
-import requests
+"""End-to-end load generator for /analyze-scam.
+
+Starts a local mock of the GUVI callback endpoint, launches the API under
+uvicorn pointed at it, then drives multi-turn scam sessions from many
+concurrent clients at a target request rate.
+
+    python test_script.py                                  # one run, defaults
+    python test_script.py --rps 200 --clients 32 --duration 30
+    python test_script.py --callback-latency 0 0.2 1 2     # sweep callback latency
+    python test_script.py --url http://127.0.0.1:8000      # use a running server
+    python test_script.py --demo                           # the original 4-turn walkthrough
+
+Reports throughput, latency percentiles, error rate and callback lag (time
+from a session's last message to its callback arriving at the mock).
+"""
+import argparse
 import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
 import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
 
 # Configuration
 API_URL = "http://127.0.0.1:8000/analyze-scam"
@@ -13,20 +38,229 @@ headers = {
     "Content-Type": "application/json"
 }
 
+# A scripted scam conversation; every session replays it turn by turn.
+SCAM_TURNS = [
+    "Hello, I am calling from your bank.",
+    "Your KYC is expired. We will block your account in 10 minutes if you don't update.",
+    "Please click here to update immediately: http://update-kyc-bank.com/login",
+    "You need to pay a reactivation fee of 10rs to verify. Send to manager@upi",
+    "Sir this is the final notice. Police case will be filed, pay the penalty now to 9876543210",
+    "Why are you not paying? Transfer the amount immediately or your account is blocked today.",
+]
+BENIGN_TURNS = [
+    "Hey, are we still meeting for lunch tomorrow?",
+    "The train is running late, will reach by 7.",
+]
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- MOCK GUVI CALLBACK SERVER ---
+class MockGuviServer:
+    """Stand-in for the GUVI endpoint with configurable latency and failure rate."""
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, port: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.received = []  # (arrival time, sessionId)
+        self.failed = 0
+        self._lock = threading.Lock()
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if mock.latency:
+                    time.sleep(mock.latency)
+                if random.random() < mock.failure_rate:
+                    with mock._lock:
+                        mock.failed += 1
+                    code, reply = 500, b'{"status":"error"}'
+                else:
+                    payload = json.loads(body or b"{}")
+                    with mock._lock:
+                        mock.received.append((time.monotonic(), payload.get("sessionId")))
+                    code, reply = 200, b'{"status":"ok"}'
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}/api/updateHoneyPotFinalResult"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- API SERVER UNDER TEST ---
+def start_api_server(callback_url: str, quiet_period: float, workers: int):
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "GUVI_CALLBACK_URL": callback_url,
+        "CALLBACK_OUTBOX_DIR": tempfile.mkdtemp(prefix="outbox-"),
+        "CALLBACK_QUIET_PERIOD": str(quiet_period),
+    })
+    # Measure the server, not its admission limits (override from the environment to test those)
+    env.setdefault("API_KEY_RATE", "1000000")
+    env.setdefault("API_KEY_BURST", "1000000")
+    if workers > 1:
+        # Sessions hop between workers; they need one shared store
+        env.setdefault("SESSION_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="sessions-"), "sessions.db"))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base + "/docs", timeout=0.5)
+            return proc, base
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("API server did not start")
+
+
+def stop_api_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# --- LOAD DRIVER ---
+def run_load(base_url: str, mock: MockGuviServer, rps: float, clients: int, duration: float,
+             scam_ratio: float, drain: float) -> dict:
+    url = base_url + "/analyze-scam"
+    latencies = []
+    errors = 0
+    last_sent = {}  # sessionId -> monotonic time of its latest message
+    lock = threading.Lock()
+    start = time.monotonic()
+    next_slot = [start]
+    interval = 1.0 / rps
+
+    def client(worker_id: int):
+        nonlocal errors
+        http = requests.Session()
+        rng = random.Random(worker_id)
+        session_no = 0
+        while True:
+            session_no += 1
+            session_id = f"load-{worker_id}-{session_no}"
+            turns = SCAM_TURNS if rng.random() < scam_ratio else BENIGN_TURNS
+            history = []
+            for text in turns:
+                # Global pacing: every request claims the next slot on the schedule.
+                with lock:
+                    slot = next_slot[0]
+                    next_slot[0] += interval
+                if slot - start >= duration:
+                    return
+                delay = slot - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                msg = {"text": text, "sender": "scammer", "timestamp": int(time.time() * 1000)}
+                payload = {"sessionId": session_id, "message": msg, "conversationHistory": history}
+                sent = time.monotonic()
+                try:
+                    response = http.post(url, headers=headers, json=payload, timeout=30)
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.monotonic() - sent
+                with lock:
+                    latencies.append(elapsed)
+                    last_sent[session_id] = sent
+                    if not ok:
+                        errors += 1
+                history = history + [msg]
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - start
+
+    # Give coalesced/queued callbacks time to arrive.
+    time.sleep(drain)
+
+    with mock._lock:
+        received = list(mock.received)
+        callback_failures = mock.failed
+    lags = sorted(max(0.0, arrived - last_sent[sid]) for arrived, sid in received if sid in last_sent)
+    latencies.sort()
+    total = len(latencies)
+    return {
+        "requests": total,
+        "throughput_rps": total / wall if wall else 0.0,
+        "error_rate": errors / total if total else 0.0,
+        "latency_ms": {
+            "p50": _percentile(latencies, 0.50) * 1e3,
+            "p90": _percentile(latencies, 0.90) * 1e3,
+            "p99": _percentile(latencies, 0.99) * 1e3,
+            "max": (latencies[-1] * 1e3) if latencies else 0.0,
+        },
+        "callbacks_received": len(received),
+        "callback_failures_injected": callback_failures,
+        "callback_lag_s": {
+            "p50": _percentile(lags, 0.50),
+            "p99": _percentile(lags, 0.99),
+            "max": lags[-1] if lags else 0.0,
+        },
+    }
+
+
+def _print_result(callback_latency, result):
+    lat = result["latency_ms"]
+    lag = result["callback_lag_s"]
+    print(f"callback latency {callback_latency:>5.2f}s | {result['throughput_rps']:7.1f} req/s | "
+          f"p50 {lat['p50']:6.1f} ms  p99 {lat['p99']:7.1f} ms  max {lat['max']:7.1f} ms | "
+          f"errors {result['error_rate']:.2%} | callbacks {result['callbacks_received']} "
+          f"lag p50 {lag['p50']:.2f}s p99 {lag['p99']:.2f}s")
+
+
+# --- THE ORIGINAL SIMULATION ---
 def send_message(text):
     print(f"\n🔴 Scammer says: {text}")
-    
+
     # FIX: Added 'sender' and 'timestamp' to match your strict schema
     payload = {
         "sessionId": SESSION_ID,
         "message": {
             "text": text,
-            "sender": "scammer",  
+            "sender": "scammer",
             "timestamp": int(time.time())
         },
         "conversationHistory": []
     }
-    
+
     try:
         response = requests.post(API_URL, headers=headers, json=payload)
         if response.status_code == 200:
@@ -42,24 +276,62 @@ def send_message(text):
     except Exception as e:
         print(f"❌ Connection Failed: {e}")
 
-# --- THE SIMULATION ---
-print("--- STARTING SCAM SIMULATION ---")
 
-# Turn 1: Generic opening
-send_message("Hello, I am calling from your bank.")
-time.sleep(1)
+def run_demo():
+    print("--- STARTING SCAM SIMULATION ---")
+    for text in SCAM_TURNS[:4]:
+        send_message(text)
+        time.sleep(1)
+    print("\n--- SIMULATION END ---")
+    print("Check your terminal running uvicorn. You should see the background task triggering.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--demo", action="store_true", help="run the original walkthrough against API_URL")
+    parser.add_argument("--url", help="target an already running server instead of starting one")
+    parser.add_argument("--rps", type=float, default=100, help="target requests per second")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per run")
+    parser.add_argument("--scam-ratio", type=float, default=0.7, help="fraction of sessions that are scams")
+    parser.add_argument("--callback-latency", type=float, nargs="+", default=[0.0],
+                        help="mock callback latency in seconds; several values run a sweep")
+    parser.add_argument("--callback-failure-rate", type=float, default=0.0)
+    parser.add_argument("--quiet-period", type=float, default=1.0, help="CALLBACK_QUIET_PERIOD for the server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for callbacks after load")
+    parser.add_argument("--json", dest="json_out", help="write all results to this file")
+    args = parser.parse_args(argv)
+
+    if args.demo:
+        run_demo()
+        return 0
 
-# Turn 2: Urgency + Threat
-send_message("Your KYC is expired. We will block your account in 10 minutes if you don't update.")
-time.sleep(1)
+    results = []
+    for callback_latency in args.callback_latency:
+        mock = MockGuviServer(latency=callback_latency, failure_rate=args.callback_failure_rate)
+        proc = None
+        try:
+            if args.url:
+                base = args.url.rstrip("/")
+                print(f"Using running server {base}; its GUVI_CALLBACK_URL must point at {mock.url}")
+            else:
+                proc, base = start_api_server(mock.url, args.quiet_period, args.workers)
+            result = run_load(base, mock, args.rps, args.clients, args.duration, args.scam_ratio,
+                              args.drain + args.quiet_period)
+        finally:
+            if proc is not None:
+                stop_api_server(proc)
+            mock.stop()
+        result["callback_latency_s"] = callback_latency
+        results.append(result)
+        _print_result(callback_latency, result)
 
-# Turn 3: The Agent should bait for the link now. Scammer sends link.
-send_message("Please click here to update immediately: http://update-kyc-bank.com/login")
-time.sleep(1)
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
 
-# Turn 4: The Agent should stall or ask for UPI. Scammer sends UPI.
-send_message("You need to pay a reactivation fee of 10rs to verify. Send to manager@upi")
-time.sleep(1)
 
-print("\n--- SIMULATION END ---")
-print("Check your terminal running uvicorn. You should see the background task triggering.")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())